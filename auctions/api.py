@@ -0,0 +1,170 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .cache import get_versions
+from .db import read_only
+from .history import BUCKETS, MAX_BUCKETS, series_cache
+from .models import Category, Listing, ListingArchive, Bid, ArchivedBid
+from .util import CommentPage, paginate
+
+# Number of bids returned per page of a listing's bids
+BIDS_PAGE_SIZE = 100
+
+LISTING_FIELDS = ("id", "title", "description", "image_url", "starting_bid",
+                  "current_bid", "bid_count", "active", "ends_at")
+
+
+def api_view(*scopes):
+    """
+    Serve a read-only JSON view with a strong ETag built from the versions
+    of the scopes it shows (as in cache_anonymous_page), so a matching
+    If-None-Match is answered with a 304 before the view runs at all.
+    These versions are only shared by processes sharing the cache.
+    """
+    def etag(request, *args, **kwargs):
+        names = [scope(**kwargs) if callable(scope) else scope
+                 for scope in scopes]
+        versions = ":".join(map(str, get_versions(names)))
+        return hashlib.md5(
+            f"{versions}:{request.get_full_path()}".encode()).hexdigest()
+    return conditional_view(etag)
+
+
+def listing_api_view(view):
+    """
+    Serve a read-only JSON view of one listing like api_view, with the ETag
+    built from the listing's version column instead, which every process
+    reads alike and which changes in the transaction of each bid, comment
+    or close rather than after it.
+    """
+    def etag(request, id, **kwargs):
+        row = Listing.objects.filter(id=id).values_list(
+            "version", "category__name", "seller__username").first()
+        return hashlib.md5(
+            f"{row}:{request.get_full_path()}".encode()).hexdigest()
+    return conditional_view(etag)(view)
+
+
+def conditional_view(etag):
+    def decorator(view):
+        @wraps(view)
+        @require_safe
+        @condition(etag_func=etag)
+        @read_only
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            # Clients keep the body but check the ETag before reusing it
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def not_found(message):
+    return JsonResponse({"error": message}, status=404)
+
+
+def listing_values(listings, **expressions):
+    return listings.values(*LISTING_FIELDS,
+                           category_name=F("category__name"),
+                           seller_name=F("seller__username"), **expressions)
+
+
+def listing_page(request, listings):
+    page, next_cursor, prev_cursor = paginate(
+        listing_values(listings), request.GET.get("cursor"))
+    return JsonResponse({
+        "listings": page,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    })
+
+
+def id_page(request, name, rows, page_size=BIDS_PAGE_SIZE):
+    """
+    Return one page of rows ordered by id, after the id given by the
+    "after" parameter, with the cursor of the next page if there is one.
+    """
+    after = request.GET.get("after", "")
+    rows = rows.order_by("id")
+    if after.isdigit():
+        rows = rows.filter(id__gt=after)
+    page = list(rows[:page_size + 1])
+    return JsonResponse({
+        name: page[:page_size],
+        "next_cursor": (page[page_size - 1]["id"]
+                        if len(page) > page_size else None)
+    })
+
+
+@api_view("listings", "categories")
+def listings(request):
+    return listing_page(request, Listing.objects.active())
+
+
+@listing_api_view
+def listing(request, id):
+    listing = listing_values(Listing.objects.filter(id=id),
+                             winner_name=F("winner__username")).first()
+    if listing is None:
+        return not_found("No such listing.")
+    return JsonResponse(listing)
+
+
+@listing_api_view
+def bids(request, id):
+    # Bids can't be placed once a listing is closed, let alone archived
+    if ListingArchive.objects.filter(listing_id=id).exists():
+        bids = ArchivedBid.objects.filter(item_id=id).values(
+            "id", "bid_ammount", "bidder_name")
+    else:
+        bids = Bid.objects.filter(item_id=id).values(
+            "id", "bid_ammount", bidder_name=F("bidder__username"))
+    return id_page(request, "bids", bids)
+
+
+@listing_api_view
+def comments(request, id):
+    after = request.GET.get("after", "")
+    page = CommentPage(id, int(after) if after.isdigit() else None)
+    return JsonResponse({
+        "comments": page.items,
+        "next_cursor": page.next_cursor
+    })
+
+
+@listing_api_view
+def history(request, id):
+    # Bid history in buckets, optionally between start and end Unix times
+    params = {}
+    for name in ("buckets", "start", "end"):
+        value = request.GET.get(name, "")
+        params[name] = int(value) if value.isdigit() else None
+    buckets = min(max(params.pop("buckets") or BUCKETS, 1), MAX_BUCKETS)
+    history = series_cache.history(id, buckets, **params)
+    if history is None:
+        return not_found("No such listing.")
+    return JsonResponse(history)
+
+
+@api_view("categories")
+def categories(request):
+    return JsonResponse({
+        "categories": list(Category.objects.order_by("name").values(
+            "id", "name"))
+    })
+
+
+@api_view(lambda category_name: f"category:{category_name}")
+def category(request, category_name):
+    category_id = Category.objects.filter(name=category_name).values_list(
+        "id", flat=True).first()
+    if category_id is None:
+        return not_found("No such category.")
+    return listing_page(
+        request, Listing.objects.active().filter(category_id=category_id))
@@ -0,0 +1,123 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .db import archive_database
+from .models import (Listing, ListingArchive, Bid, Comment, ArchivedBid,
+                     ArchivedComment)
+
+# Days an auction stays closed before its bids and comments are archived
+ARCHIVE_AFTER_DAYS = 90
+
+# Number of listings archived per batch
+BATCH_SIZE = 200
+
+
+def archivable(days=ARCHIVE_AFTER_DAYS, now=None):
+    # Listings closed more than days ago and not archived yet, by id
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Listing.objects.filter(
+        active=False, closed_at__lt=cutoff,
+        archive__isnull=True).order_by("id")
+
+
+def archive_batch(listing_ids):
+    """
+    Move the bids and comments of the listings to the archive database,
+    and leave a ListingArchive row for each listing. Return the number of
+    bids and comments moved.
+
+    Rows are first copied under their own ids, then deleted together with
+    the writing of the summaries, each step in its own transaction. If the
+    second step doesn't happen, the batch is simply done again: copies
+    already made are skipped, and nothing is lost or counted twice.
+    """
+    bids = list(Bid.objects.filter(item_id__in=listing_ids).values_list(
+        "id", "item_id", "bid_ammount", "bidder_id", "bidder__username",
+        "created"))
+    comments = list(Comment.objects.filter(
+        listing_id__in=listing_ids).values_list(
+        "id", "listing_id", "comment", "user_id", "user__username"))
+
+    with transaction.atomic(using=archive_database()):
+        ArchivedBid.objects.bulk_create(
+            (ArchivedBid(id=bid_id, item_id=item_id, bid_ammount=amount,
+                         bidder_id=bidder_id, bidder_name=bidder_name,
+                         created=created)
+             for bid_id, item_id, amount, bidder_id, bidder_name, created
+             in bids),
+            batch_size=1000, ignore_conflicts=True)
+        ArchivedComment.objects.bulk_create(
+            (ArchivedComment(id=comment_id, listing_id=listing_id,
+                             comment=comment, user_id=user_id,
+                             user_name=user_name)
+             for comment_id, listing_id, comment, user_id, user_name
+             in comments),
+            batch_size=1000, ignore_conflicts=True)
+
+    bid_counts = Counter(bid[1] for bid in bids)
+    comment_counts = Counter(comment[1] for comment in comments)
+    first_bids, last_bids = {}, {}
+    for _, item_id, _, _, _, created in bids:
+        if created is not None:
+            first_bids[item_id] = min(first_bids.get(item_id, created),
+                                      created)
+            last_bids[item_id] = max(last_bids.get(item_id, created), created)
+
+    with transaction.atomic():
+        ListingArchive.objects.bulk_create(
+            ListingArchive(listing_id=listing_id,
+                           bid_count=bid_counts[listing_id],
+                           comment_count=comment_counts[listing_id],
+                           first_bid=first_bids.get(listing_id),
+                           last_bid=last_bids.get(listing_id))
+            for listing_id in listing_ids)
+        # Comments can still be posted on closed listings: those posted
+        # since the rows were read have higher ids and are left in place
+        if bids:
+            delete_rows(Bid, "item", listing_ids, max(bid[0] for bid in bids))
+        if comments:
+            delete_rows(Comment, "listing", listing_ids,
+                        max(comment[0] for comment in comments))
+    return len(bids), len(comments)
+
+
+def delete_rows(model, listing_field, listing_ids, last_id):
+    """
+    Delete the rows of the listings with ids up to last_id in one
+    statement, without the per-row post_delete signals of
+    QuerySet.delete(): nothing shown changes, so there is nothing to
+    invalidate.
+    """
+    connection = connections[model.objects.db]
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(listing_field).column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(column)} IN "
+            f"({', '.join(['%s'] * len(listing_ids))}) AND id <= %s",
+            [*listing_ids, last_id])
+
+
+def archive_listings(days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE,
+                     limit=None):
+    """
+    Archive the listings closed more than days ago, batch_size at a time,
+    stopping after limit listings if given. Yield the number of listings,
+    bids and comments of each batch. Progress is the ListingArchive rows
+    themselves, so the job can be stopped at any point and run again.
+    """
+    archived = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else \
+            min(batch_size, limit - archived)
+        listing_ids = list(archivable(days).values_list("id", flat=True)[
+            :size])
+        if not listing_ids:
+            return
+        bids, comments = archive_batch(listing_ids)
+        archived += len(listing_ids)
+        yield len(listing_ids), bids, comments
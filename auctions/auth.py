@@ -0,0 +1,37 @@
+import copy
+import threading
+import time
+
+from django.contrib.auth.backends import ModelBackend
+
+# Seconds a user loaded for a session is reused without a query. Changes
+# made by this process are seen at once; others' after at most this long.
+USER_TTL = 30
+
+_users = {}
+_users_lock = threading.Lock()
+
+
+class CachedUserBackend(ModelBackend):
+    """
+    ModelBackend whose get_user, run by AuthenticationMiddleware on every
+    authenticated request, serves users from a short-lived in-process cache.
+    """
+
+    def get_user(self, user_id):
+        now = time.monotonic()
+        with _users_lock:
+            expires, user = _users.get(user_id, (0, None))
+        if expires <= now:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            with _users_lock:
+                _users[user_id] = (now + USER_TTL, user)
+        # Each request gets its own copy, as requests annotate their user
+        return copy.copy(user)
+
+
+def forget_user(user_id):
+    with _users_lock:
+        _users.pop(user_id, None)
@@ -0,0 +1,103 @@
+import logging
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Listing, Bid
+from .stats import update_category_stats
+
+logger = logging.getLogger(__name__)
+
+# How often a bid is retried when the database is locked by another writer
+MAX_RETRIES = 5
+RETRY_DELAY = 0.01
+
+
+class BidError(Exception):
+    pass
+
+
+def place_bid(listing, bidder, bid_ammount):
+    """
+    Place a bid on an active listing, or raise BidError if it does not beat
+    the current one.
+
+    The listing's current bid is swapped with a single conditional UPDATE on
+    the values last read, so of two concurrent bids only one can win, the
+    other checking again against the winner. The Bid row is inserted and
+    the category summary updated in the same transaction, and only that
+    transaction is retried: once it has committed the bid is placed, even
+    if a commit hook fails.
+    """
+    attempt = 0
+    while True:
+        current = _current_bid(listing, bid_ammount)
+        committed = []
+        try:
+            with transaction.atomic():
+                # Registered first, so it has run if a later hook fails
+                transaction.on_commit(lambda: committed.append(True))
+                bid = _place_bid(listing, bidder, bid_ammount, current)
+        except Exception as error:
+            if committed:
+                # Placing the bid again would record it twice
+                logger.exception("Bid %s on listing %s was placed, but a "
+                                 "commit hook failed.", bid.id, listing.id)
+                return bid
+            if not isinstance(error, OperationalError) or \
+                    attempt == MAX_RETRIES - 1:
+                raise
+            # Another writer holds the lock (SQLite "database is locked")
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(1, 2))
+            attempt += 1
+            continue
+        if bid is not None:
+            return bid
+
+
+def _current_bid(listing, bid_ammount):
+    # The listing's row as it is now, if the bid beats it
+    current = Listing.objects.filter(id=listing.id).values(
+        "active", "ends_at", "current_bid", "bid_count", "category_id").get()
+    listing.current_bid = current["current_bid"]
+    listing.bid_count = current["bid_count"]
+    ends_at = current["ends_at"]
+    if not current["active"] or (ends_at and ends_at <= timezone.now()):
+        raise BidError("This auction is closed.")
+    if not current["bid_count"]:
+        if bid_ammount < current["current_bid"]:
+            raise BidError(
+                "Your bid must be higher than or equal to the starting bid.")
+    elif bid_ammount <= current["current_bid"]:
+        raise BidError("Your bid must be higher than the current bid.")
+    return current
+
+
+def _place_bid(listing, bidder, bid_ammount, current):
+    # The bid, or None if another bid changed the listing since it was read
+
+    # Not ended, even if the expiry worker hasn't closed it yet
+    open_now = Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now())
+    updated = Listing.objects.filter(
+        open_now, id=listing.id, active=True,
+        current_bid=current["current_bid"], bid_count=current["bid_count"],
+    ).update(
+        current_bid=bid_ammount,
+        bid_count=F("bid_count") + 1,
+        highest_bidder=bidder,
+        version=F("version") + 1)
+    if not updated:
+        return None
+
+    bid = Bid.objects.create(
+        item=listing, bid_ammount=bid_ammount, bidder=bidder)
+    update_category_stats(current["category_id"], listing.id,
+                          current["current_bid"], bid_ammount)
+
+    listing.current_bid = bid_ammount
+    listing.bid_count += 1
+    listing.highest_bidder = bidder
+    return bid
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from .cards import render_card
+from .models import Watchlist
+
+# Seconds a cached page or listing card is kept
+CACHE_TIMEOUT = 300
+
+_stats = {"pages": {"hits": 0, "misses": 0},
+          "cards": {"hits": 0, "misses": 0}}
+_stats_lock = threading.Lock()
+
+
+def _count(kind, hits=0, misses=0):
+    with _stats_lock:
+        _stats[kind]["hits"] += hits
+        _stats[kind]["misses"] += misses
+
+
+def cache_stats():
+    # Hits and misses of this process since it started
+    stats = {}
+    with _stats_lock:
+        for kind, counts in _stats.items():
+            total = counts["hits"] + counts["misses"]
+            stats[kind] = dict(
+                counts, hit_ratio=counts["hits"] / total if total else None)
+    return stats
+
+
+def get_versions(scopes):
+    """
+    Return the current version of each scope, e.g. "listings" or
+    "listing:12". Cached entries embed the versions of the scopes they
+    depend on, so bumping a version invalidates them without a key scan.
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    # Start from the clock so a version key evicted from the cache can't
+    # come back with a number that old entries were stored under
+    start = time.time_ns()
+    missing = {key: start for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            # Never read yet, so nothing cached depends on it
+            pass
+
+
+def _version_key(scope):
+    # Scopes may hold category names, which can't go in memcached keys as is
+    return "version:" + quote(scope, safe=":")
+
+
+def cache_anonymous_page(*scopes):
+    """
+    Cache the whole response of a view for anonymous GET requests. Each
+    scope is a string, or a function of the view's kwargs returning one,
+    naming data the page shows.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            names = [scope(**kwargs) if callable(scope) else scope
+                     for scope in scopes]
+            versions = ":".join(map(str, get_versions(names)))
+            path = hashlib.md5(
+                request.get_full_path().encode()).hexdigest()
+            key = f"page:{view.__name__}:{versions}:{path}"
+
+            response = cache.get(key)
+            if response is not None:
+                _count("pages", hits=1)
+                return response
+
+            _count("pages", misses=1)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response, CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def render_listing_cards(listings):
+    """
+    Add the rendered card markup to each listing dict, reusing cards cached
+    since the listing last changed.
+    """
+    listings = list(listings)
+    versions = get_versions([f"listing:{l['id']}" for l in listings])
+    keys = [f"card:{l['id']}:{version}"
+            for l, version in zip(listings, versions)]
+    cards = cache.get_many(keys)
+    _count("cards", hits=len(cards), misses=len(keys) - len(cards))
+
+    rendered = {}
+    for listing, key in zip(listings, keys):
+        if key not in cards:
+            cards[key] = rendered[key] = render_card(listing)
+        listing["card"] = mark_safe(cards[key])
+    if rendered:
+        cache.set_many(rendered, CACHE_TIMEOUT)
+    return listings
+
+
+def watchlist_ids(request):
+    """
+    Return the set of listing ids on the user's watchlist. It is loaded
+    from the cache at most once per request and from the database only
+    after the watchlist changed.
+    """
+    if not hasattr(request, "_watchlist_ids"):
+        key = f"watchlist:{request.user.id}"
+        ids = cache.get(key)
+        if ids is None:
+            ids = set(Watchlist.objects.filter(
+                user_id=request.user.id).values_list("listing_id", flat=True))
+            cache.set(key, ids, CACHE_TIMEOUT)
+        request._watchlist_ids = ids
+    return request._watchlist_ids
+
+
+def forget_watchlist(user_id):
+    cache.delete(f"watchlist:{user_id}")
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.html import escape
+
+from .thumbnails import thumbnail_url
+from .util import url_prefix
+
+CARD_TEMPLATE = "auctions/listing-card.html"
+
+# The markup of CARD_TEMPLATE, filled in by render_card_fast
+_CARD = """<a href="{url}">
+    {image}
+    </a>
+    <div class="info">
+        <h3>
+            <a href="{url}">
+                {title}
+            </a>
+        </h3>
+        <p>{description}</p>
+        <h4>${current_bid}</h4>
+    </div>
+"""
+_IMAGE = ('\n        <img src="{src}" alt="{title}" width="200" height="200">'
+          '\n    ')
+_NO_IMAGE = '\n        <div class="no-img"></div>\n    '
+
+
+def render_card_template(listing):
+    return render_to_string(CARD_TEMPLATE, {"listing": listing})
+
+
+def render_card_fast(listing):
+    """
+    Render the same markup as CARD_TEMPLATE from a listing dict with string
+    formatting, skipping the template engine's per-node work. Keep the two
+    in step; auctions.tests checks that they match.
+    """
+    title = escape(listing["title"])
+    if listing["image_url"]:
+        image = _IMAGE.format(
+            src=escape(thumbnail_url(listing["image_url"], 200)), title=title)
+    else:
+        image = _NO_IMAGE
+    return _CARD.format(
+        url=escape(url_prefix("listing") + str(listing["id"])),
+        image=image, title=title, description=escape(listing["description"]),
+        current_bid=escape(listing["current_bid"]))
+
+
+def render_card(listing):
+    # Markup of one listing card, from a dict of get_active_listings
+    if settings.LISTING_CARD_FAST_PATH:
+        return render_card_fast(listing)
+    return render_card_template(listing)
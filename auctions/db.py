@@ -0,0 +1,98 @@
+import contextvars
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Alias of the read-only connection used by read_only views
+REPLICA = "replica"
+
+# Alias of the database holding archived bids and comments, if configured
+ARCHIVE = "archive"
+
+# Models stored in the archive database, by model name
+ARCHIVE_MODELS = {"archivedbid", "archivedcomment"}
+
+_read_only = contextvars.ContextVar("read_only", default=False)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    # Apply SQLITE_PRAGMAS to every new SQLite connection
+    if connection.vendor != "sqlite":
+        return
+    pragmas = dict(getattr(settings, "SQLITE_PRAGMAS", {}))
+    if connection.alias == REPLICA:
+        # The journal mode belongs to the file and can't be set read-only
+        pragmas.pop("journal_mode", None)
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+def archive_database():
+    # Alias the archive models are stored in
+    return ARCHIVE if ARCHIVE in settings.DATABASES else "default"
+
+
+def read_only(view):
+    """
+    Send the ORM reads of a view's GET and HEAD requests to the read-only
+    replica connection, when one is configured.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+        token = _read_only.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+class ArchiveRouter:
+    """
+    Keep the archive models in the archive database, and nothing else
+    there. List it before ReplicaRouter, which answers for every model.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.model_name in ARCHIVE_MODELS:
+            return archive_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name in ARCHIVE_MODELS:
+            return db == archive_database()
+        if db == ARCHIVE:
+            return False
+        return None
+
+
+class ReplicaRouter:
+    """
+    Route reads made inside read_only views to the replica, and everything
+    else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (_read_only.get() and REPLICA in settings.DATABASES and
+                not transaction.get_connection().in_atomic_block):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both connections open the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
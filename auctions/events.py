@@ -0,0 +1,116 @@
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from .models import Listing
+
+# Path of a listing's event stream, served by commerce.asgi
+EVENTS_PATH = re.compile(r"^/listing/(\d+)/events$")
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT = 15
+
+# Events buffered for a slow watcher before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe of listing events. Publishers are regular
+    (sync) Django code; each subscriber is an asyncio queue drained by one
+    event stream, fed thread-safely through its own event loop.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, listing_id):
+        subscriber = (asyncio.get_running_loop(),
+                      asyncio.Queue(maxsize=QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[listing_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, listing_id, subscriber):
+        with self._lock:
+            self._subscribers[listing_id].discard(subscriber)
+            if not self._subscribers[listing_id]:
+                del self._subscribers[listing_id]
+
+    def watchers(self, listing_id):
+        with self._lock:
+            return len(self._subscribers.get(listing_id, ()))
+
+    def publish(self, listing_id, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+        with self._lock:
+            subscribers = list(self._subscribers.get(listing_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, message)
+
+
+def _offer(queue, message):
+    # A watcher that falls behind loses its oldest events, not the newest
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+broker = EventBroker()
+
+
+async def listing_events(scope, receive, send, listing_id):
+    """
+    ASGI app streaming a listing's bid, comment and close events as
+    Server-Sent Events until the client disconnects.
+    """
+    exists = await sync_to_async(
+        Listing.objects.filter(id=listing_id).exists)()
+    if not exists:
+        await send({"type": "http.response.start", "status": 404,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Not Found"})
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    subscriber = broker.subscribe(listing_id)
+    _, queue = subscriber
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            message = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {message, disconnected}, timeout=HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                message.cancel()
+                break
+            if message in done:
+                body = message.result()
+            else:
+                message.cancel()
+                body = b": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": body,
+                        "more_body": True})
+    finally:
+        broker.unsubscribe(listing_id, subscriber)
+        disconnected.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
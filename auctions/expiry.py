@@ -0,0 +1,128 @@
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Listing
+from .signals import listings_closed
+
+logger = logging.getLogger(__name__)
+
+
+def close_listings(listings, now=None):
+    """
+    Close the still active listings of a queryset with one conditional
+    UPDATE, the winner being the highest bidder as stored at that moment,
+    and return how many were closed. Nothing else of the rows is written,
+    so a bid swapped in concurrently is never overwritten.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        closed = listings.filter(active=True).update(
+            active=False, winner=F("highest_bidder"), closed_at=now,
+            version=F("version") + 1)
+        # Read back in the same transaction: those closed just now
+        closing = list(listings.filter(active=False, closed_at=now).values(
+            "id", "category_id", "category__name", "current_bid",
+            "bid_count", "highest_bidder"))
+        # The outbox events commit with the close, or not at all
+        listings_closed(closing)
+    return closed
+
+
+class ExpiryScheduler:
+    """
+    Close auctions when their ends_at passes.
+
+    Listings ending within the next horizon seconds are loaded from the
+    ends_at index into a heap, so a tick only pops what is due instead of
+    querying the listing table, and due listings are closed together in
+    bulk UPDATEs of up to batch_size rows.
+    """
+
+    def __init__(self, horizon=10, batch_size=1000):
+        self.horizon = timedelta(seconds=horizon)
+        self.batch_size = batch_size
+        self.heap = []
+        self.scheduled = {}
+        self.loaded_until = None
+
+    def schedule(self, listing_id, ends_at):
+        # An earlier entry for the listing is skipped once it comes up
+        if self.scheduled.get(listing_id) != ends_at:
+            self.scheduled[listing_id] = ends_at
+            heapq.heappush(self.heap, (ends_at, listing_id))
+
+    def refresh(self, now):
+        # Load what ends within the horizon, including ends_at changed since
+        until = now + self.horizon
+        ending = Listing.objects.filter(
+            active=True, ends_at__lte=until).values_list("id", "ends_at")
+        for listing_id, ends_at in ending.iterator(chunk_size=self.batch_size):
+            self.schedule(listing_id, ends_at)
+        self.loaded_until = until
+
+    def due(self, now):
+        ids = []
+        while self.heap and self.heap[0][0] <= now:
+            ends_at, listing_id = heapq.heappop(self.heap)
+            if self.scheduled.get(listing_id) == ends_at:
+                del self.scheduled[listing_id]
+                ids.append(listing_id)
+        return ids
+
+    def tick(self, now=None):
+        """
+        Close every auction due by now and return how many were closed.
+        """
+        now = now or timezone.now()
+        if self.loaded_until is None or \
+                now + self.horizon / 2 >= self.loaded_until:
+            self.refresh(now)
+
+        ids = self.due(now)
+        closed = 0
+        for start in range(0, len(ids), self.batch_size):
+            # Re-checked by the UPDATE, in case a listing was closed or
+            # extended
+            closed += close_listings(Listing.objects.filter(
+                id__in=ids[start:start + self.batch_size],
+                ends_at__lte=now), now)
+        return closed
+
+    def safe_tick(self, now=None):
+        """
+        Tick, logging rather than raising errors such as a locked database,
+        so a worker outlives them. Listings popped as due but not closed
+        are loaded again by the next tick.
+        """
+        try:
+            return self.tick(now)
+        except Exception:
+            logger.exception("Can't close due auctions, retrying.")
+            self.loaded_until = None
+            return 0
+
+    def run(self, stop, interval=1.0):
+        # Tick every interval seconds until the stop event is set
+        while not stop.is_set():
+            self.safe_tick()
+            stop.wait(interval)
+
+
+def start_expiry_thread(interval=1.0, **kwargs):
+    """
+    Run an ExpiryScheduler in a daemon thread of this process. Set the
+    returned event to stop it.
+    """
+    stop = threading.Event()
+    scheduler = ExpiryScheduler(**kwargs)
+    thread = threading.Thread(
+        target=scheduler.run, args=(stop, interval), daemon=True,
+        name="auction-expiry")
+    thread.start()
+    return stop
@@ -0,0 +1,232 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.db import connection
+from django.db.models import Count
+
+from .models import Listing, Watchlist
+from .util import get_active_listings
+
+logger = logging.getLogger(__name__)
+
+# Number of listings shown in each section of the index page
+TOP_N = 5
+
+# Seconds after which the boards are rebuilt from the database, to pick
+# up writes made by other processes
+REBUILD_AFTER = 600
+
+# Title of each board, in the order the index page shows them
+TITLES = {
+    "ending_soon": "Ending soon",
+    "most_bids": "Hot auctions",
+    "highest_price": "Highest price",
+    "most_watched": "Most watched",
+}
+
+
+class Leaderboard:
+    """
+    Listing ids ranked by a score, highest first (lowest first when
+    ascending), in a sorted list, so the top n are a slice and an update
+    is a bisect and a memmove.
+    """
+
+    def __init__(self, scores=(), ascending=False):
+        self.sign = 1 if ascending else -1
+        self.scores = dict(scores)
+        # Sorted once, rather than an insort per listing
+        self.ranking = sorted((self.sign * score, listing_id)
+                              for listing_id, score in self.scores.items())
+
+    def set(self, listing_id, score):
+        self.remove(listing_id)
+        self.scores[listing_id] = score
+        insort(self.ranking, (self.sign * score, listing_id))
+
+    def adjust(self, listing_id, delta):
+        # Only listings on the board are kept up to date
+        if listing_id in self.scores:
+            self.set(listing_id, self.scores[listing_id] + delta)
+
+    def remove(self, listing_id):
+        score = self.scores.pop(listing_id, None)
+        if score is not None:
+            entry = (self.sign * score, listing_id)
+            del self.ranking[bisect_left(self.ranking, entry)]
+
+    def top(self, n):
+        # Listings scoring 0 aren't on a highest first board
+        return [listing_id for key, listing_id in self.ranking[:n]
+                if self.sign > 0 or key < 0]
+
+
+class Leaderboards:
+    """
+    The active listings ending soonest and with the most bids, highest
+    current bid and most watchers. They are loaded from the denormalized
+    listing columns and one grouped watchlist query on first use, then
+    kept up to date by signals.
+
+    Every REBUILD_AFTER seconds they are built again by a thread of their
+    own, into new boards swapped in when done, so the signals only wait
+    for the lock as long as the swap takes. Listings changed meanwhile are
+    read again before the swap.
+    """
+
+    def __init__(self):
+        self.boards = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        # Held by whichever thread builds the boards
+        self.building = threading.Lock()
+        # Ids of the listings changed during a build, None if there is none
+        self.touched = None
+
+    def load(self):
+        if not self.boards:
+            # Nothing to show before the first build, made on the request
+            with self.building:
+                if not self.boards:
+                    self.rebuild()
+        elif time.monotonic() - self.loaded_at >= REBUILD_AFTER and \
+                self.building.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background,
+                             daemon=True, name="leaderboards").start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            # Tried again after REBUILD_AFTER, the old boards shown until
+            logger.exception("Can't rebuild the leaderboards.")
+            self.loaded_at = time.monotonic()
+        finally:
+            self.building.release()
+            connection.close()
+
+    def rebuild(self):
+        """
+        Build the boards from the database, with the building lock held,
+        and swap them in.
+        """
+        with self.lock:
+            self.touched = set()
+        try:
+            boards = self._build()
+            while True:
+                with self.lock:
+                    touched, self.touched = self.touched, set()
+                    if not touched:
+                        self.boards = boards
+                        self.loaded_at = time.monotonic()
+                        return
+                # Until a round goes by without changes
+                self._update(boards, touched)
+        finally:
+            with self.lock:
+                self.touched = None
+
+    def _build(self):
+        scores = {board: {} for board in TITLES}
+        for listing_id, bid_count, current_bid, ends_at in \
+                Listing.objects.active().values_list(
+                    "id", "bid_count", "current_bid", "ends_at").iterator(
+                    chunk_size=5000):
+            scores["most_bids"][listing_id] = bid_count
+            scores["highest_price"][listing_id] = current_bid
+            scores["most_watched"][listing_id] = 0
+            if ends_at is not None:
+                scores["ending_soon"][listing_id] = ends_at.timestamp()
+        for listing_id, watchers in Watchlist.objects.filter(
+                listing__active=True).values_list("listing").annotate(
+                watchers=Count("id")).order_by():
+            scores["most_watched"][listing_id] = watchers
+        return {board: Leaderboard(scores[board],
+                                   ascending=board == "ending_soon")
+                for board in TITLES}
+
+    def _update(self, boards, listing_ids):
+        # Read the listings again into boards not yet swapped in
+        for board in boards.values():
+            for listing_id in listing_ids:
+                board.remove(listing_id)
+        watchers = dict(Watchlist.objects.filter(
+            listing__in=listing_ids).values_list("listing").annotate(
+            watchers=Count("id")).order_by())
+        for listing_id, bid_count, current_bid, ends_at in \
+                Listing.objects.active().filter(
+                    id__in=listing_ids).values_list(
+                    "id", "bid_count", "current_bid", "ends_at"):
+            self._set(boards, listing_id, bid_count, current_bid, ends_at)
+            boards["most_watched"].set(listing_id,
+                                       watchers.get(listing_id, 0))
+
+    def _touch(self, listing_id):
+        if self.touched is not None:
+            self.touched.add(listing_id)
+
+    def _set(self, boards, listing_id, bid_count, current_bid, ends_at):
+        boards["most_bids"].set(listing_id, bid_count)
+        boards["highest_price"].set(listing_id, current_bid)
+        if listing_id not in boards["most_watched"].scores:
+            boards["most_watched"].set(listing_id, 0)
+        if ends_at is not None:
+            boards["ending_soon"].set(listing_id, ends_at.timestamp())
+        else:
+            boards["ending_soon"].remove(listing_id)
+
+    def listing_saved(self, listing):
+        if not listing.active:
+            self.listing_removed(listing.id)
+            return
+        with self.lock:
+            self._touch(listing.id)
+            if self.boards:
+                self._set(self.boards, listing.id, listing.bid_count,
+                          listing.current_bid, listing.ends_at)
+
+    def listing_removed(self, listing_id):
+        with self.lock:
+            self._touch(listing_id)
+            for board in self.boards.values():
+                board.remove(listing_id)
+
+    def bid_placed(self, listing_id, bid_ammount):
+        with self.lock:
+            self._touch(listing_id)
+            if self.boards:
+                self.boards["most_bids"].adjust(listing_id, 1)
+                board = self.boards["highest_price"]
+                if listing_id in board.scores:
+                    board.set(listing_id,
+                              max(board.scores[listing_id], bid_ammount))
+
+    def watchers_changed(self, listing_id, delta):
+        with self.lock:
+            self._touch(listing_id)
+            if self.boards:
+                self.boards["most_watched"].adjust(listing_id, delta)
+
+    def top(self, board, n=TOP_N):
+        self.load()
+        with self.lock:
+            return self.boards[board].top(n)
+
+
+leaderboards = Leaderboards()
+
+
+def top_listings(n=TOP_N):
+    """
+    Return a section for each board, with a title and its top n listings as
+    dicts of get_active_listings, fetched in one query.
+    """
+    ids = {board: leaderboards.top(board, n) for board in TITLES}
+    listings = {listing["id"]: listing for listing in get_active_listings(
+        Listing.objects.filter(id__in=set().union(*ids.values())))}
+    return [{"title": title,
+             "listings": [listings[i] for i in ids[board] if i in listings]}
+            for board, title in TITLES.items()]
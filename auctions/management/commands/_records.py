@@ -0,0 +1,49 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+
+# Columns of exported and imported rows, by kind of record
+FIELDS = {
+    "listings": ["id", "seller", "title", "description", "category",
+                 "image_url", "starting_bid", "current_bid", "bid_count",
+                 "active", "ends_at", "closed_at"],
+    "bids": ["id", "listing", "bidder", "bid_ammount", "created"],
+}
+
+
+def guess_format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+
+@contextmanager
+def open_stream(path, mode):
+    # "-" is stdin or stdout
+    if path == "-":
+        yield sys.stdin if "r" in mode else sys.stdout
+    else:
+        with open(path, mode, newline="", encoding="utf-8") as stream:
+            yield stream
+
+
+def read_records(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_records(stream, fmt, fields, rows):
+    # Rows are tuples in the order of fields
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        writer.writerows(rows)
+        return
+    for row in rows:
+        stream.write(json.dumps(dict(zip(fields, row)), default=str))
+        stream.write("\n")
@@ -0,0 +1,74 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+
+from auctions.models import User, Category, Listing, Watchlist, Comment, Bid
+from auctions.search import rebuild_index
+from auctions.stats import rebuild_category_stats
+
+WORDS = ("antique vintage rare signed boxed mint classic modern handmade "
+         "wooden leather silver golden red blue green lamp chair table "
+         "camera guitar watch bicycle book poster record jacket").split()
+
+# Password of every seeded user
+PASSWORD = "bench"
+
+
+def sentence(words):
+    return " ".join(random.choices(WORDS, k=words)).capitalize()
+
+
+def seed(users=100, categories=10, listings=1000, bids=10000, comments=5000,
+         watchlists=2000, batch_size=5000):
+    """
+    Fill the database with synthetic data through bulk_create, then bring
+    the denormalized bid columns and the search index up to date.
+    """
+    password = make_password(PASSWORD)
+    User.objects.bulk_create((
+        User(username=f"user{i}", email=f"user{i}@example.com",
+             password=password)
+        for i in range(users)
+    ), batch_size=batch_size)
+    user_ids = list(User.objects.values_list("id", flat=True))
+
+    Category.objects.bulk_create(
+        Category(name=f"Category {i}") for i in range(categories))
+    category_ids = list(Category.objects.values_list("id", flat=True))
+
+    def new_listing():
+        starting_bid = random.randint(1, 500)
+        return Listing(
+            seller_id=random.choice(user_ids),
+            category_id=random.choice(category_ids),
+            title=sentence(3)[:64], description=sentence(30),
+            starting_bid=starting_bid, current_bid=starting_bid,
+            active=random.random() < 0.9)
+
+    Listing.objects.bulk_create(
+        (new_listing() for _ in range(listings)), batch_size=batch_size)
+    listing_ids = list(Listing.objects.values_list("id", flat=True))
+
+    Bid.objects.bulk_create((
+        Bid(item_id=random.choice(listing_ids),
+            bidder_id=random.choice(user_ids),
+            bid_ammount=random.randint(500, 100000))
+        for _ in range(bids)
+    ), batch_size=batch_size)
+
+    Comment.objects.bulk_create((
+        Comment(listing_id=random.choice(listing_ids),
+                user_id=random.choice(user_ids), comment=sentence(8))
+        for _ in range(comments)
+    ), batch_size=batch_size)
+
+    pairs = {(random.choice(user_ids), random.choice(listing_ids))
+             for _ in range(watchlists)}
+    Watchlist.objects.bulk_create((
+        Watchlist(user_id=user_id, listing_id=listing_id)
+        for user_id, listing_id in pairs
+    ), batch_size=batch_size)
+
+    Listing.objects.rebuild_bid_stats()
+    rebuild_index()
+    rebuild_category_stats()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from auctions.db import ARCHIVE
+
+
+@contextmanager
+def throwaway_database(on_disk=False):
+    """
+    Run the block against a freshly migrated test database that is destroyed
+    afterwards. Pass on_disk=True when several threads need to share it, as
+    SQLite's in-memory test database can't be written concurrently.
+    Connections set up as TEST MIRROR of the default one (the replica) use
+    the test database too, and the archive database gets one of its own.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    if on_disk and connection.vendor == "sqlite":
+        directory = tempfile.mkdtemp()
+        test_settings["NAME"] = os.path.join(directory, "bench.sqlite3")
+
+    mirrors = {
+        alias: connections[alias].settings_dict["NAME"]
+        for alias in connections
+        if connections[alias].settings_dict.get("TEST", {}).get(
+            "MIRROR") == DEFAULT_DB_ALIAS
+    }
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True)
+    archive = connections[ARCHIVE] if ARCHIVE in connections else None
+    if archive:
+        old_archive_name = archive.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+    for alias in mirrors:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(
+            connection.settings_dict)
+    try:
+        yield
+    finally:
+        for alias, name in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if archive:
+            archive.creation.destroy_test_db(old_archive_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.archive import ARCHIVE_AFTER_DAYS, BATCH_SIZE, archive_listings
+
+
+class Command(BaseCommand):
+    help = ("Move the bids and comments of auctions closed more than --days "
+            "ago to the archive database, a batch of listings per "
+            "transaction. It can be stopped at any point and run again, "
+            "e.g. daily, and carries on where it left off.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--limit", type=int,
+                            help="Archive at most this many listings.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        totals = [0, 0, 0]
+        for batch in archive_listings(options["days"], options["batch_size"],
+                                      options["limit"]):
+            totals = [total + count for total, count in zip(totals, batch)]
+            if options["verbosity"] > 1:
+                self.stdout.write("Archived {} listings, {} bids and {} "
+                                  "comments.".format(*batch))
+        listings, bids, comments = totals
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {listings} listings with {bids} bids and {comments} "
+            f"comments in {elapsed:.1f} s."))
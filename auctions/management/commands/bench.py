@@ -0,0 +1,247 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager, nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from auctions.models import User, Category, Listing
+from ._seed import seed, sentence, WORDS
+from ._testdb import throwaway_database
+
+# Relative weight of each operation in the default workload
+DEFAULT_MIX = {
+    "index": 30,
+    "index_next_page": 5,
+    "listing": 25,
+    "categories": 5,
+    "category": 10,
+    "search": 5,
+    "watchlist": 5,
+    "bid": 8,
+    "comment": 4,
+    "add_to_watchlist": 3,
+}
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database, replay a mixed read/write workload "
+            "from several threads through the test client, and report "
+            "latency percentiles, queries per request and requests/sec per "
+            "view as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--listings", type=int, default=5000)
+        parser.add_argument("--bids", type=int, default=50000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--watchlists", type=int, default=5000)
+        parser.add_argument("--requests", type=int, default=2000,
+                            help="Requests replayed in total.")
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--anonymous", type=float, default=0.5,
+                            help="Share of read requests made logged out.")
+        parser.add_argument("--mix",
+                            help="JSON file of operation weights overriding "
+                                 "the default workload.")
+        parser.add_argument("--untuned", action="store_true",
+                            help="Run without SQLITE_PRAGMAS, the replica "
+                                 "router and persistent connections, to "
+                                 "compare against a tuned run.")
+        parser.add_argument("--output", default="bench-results.json")
+        parser.add_argument("--compare",
+                            help="Earlier results file to print deltas "
+                                 "against.")
+
+    def handle(self, *args, **options):
+        mix = dict(DEFAULT_MIX)
+        if options["mix"]:
+            with open(options["mix"]) as f:
+                mix.update(json.load(f))
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise CommandError(f"Unknown operations: {', '.join(unknown)}")
+
+        with untuned() if options["untuned"] else nullcontext(), \
+                throwaway_database(on_disk=True):
+            start = time.perf_counter()
+            seed(users=options["users"], listings=options["listings"],
+                 bids=options["bids"], comments=options["comments"],
+                 watchlists=options["watchlists"])
+            self.stdout.write(
+                f"Seeded in {time.perf_counter() - start:.1f} s.")
+            results = self.replay(mix, options)
+
+        results["config"] = {
+            key: options[key] for key in (
+                "users", "listings", "bids", "comments", "watchlists",
+                "requests", "threads", "anonymous", "untuned")
+        }
+        results["config"]["mix"] = mix
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+        self.report(results, previous)
+        self.stdout.write(self.style.SUCCESS(
+            f"Results saved to {options['output']}."))
+
+    def replay(self, mix, options):
+        users = list(User.objects.values_list("username", flat=True))
+        listing_ids = list(Listing.objects.filter(active=True)
+                           .values_list("id", flat=True))
+        categories = list(Category.objects.values_list("name", flat=True))
+        first_page_end = listing_ids[min(len(listing_ids), 24) - 1]
+        # Threads open their own connections to the same database file
+        connection.close()
+
+        operations, weights = zip(*mix.items())
+        samples = defaultdict(list)
+        lock = threading.Lock()
+
+        def run(requests):
+            anonymous = Client()
+            logged_in = Client()
+            logged_in.force_login(
+                User.objects.get(username=random.choice(users)))
+            measured = defaultdict(list)
+            try:
+                for _ in range(requests):
+                    operation = random.choices(operations, weights)[0]
+                    listing_id = random.choice(listing_ids)
+                    writes = operation in (
+                        "bid", "comment", "add_to_watchlist", "watchlist")
+                    client = logged_in if (
+                        writes or random.random() >= options["anonymous"]
+                    ) else anonymous
+
+                    with ExitStack() as stack:
+                        # Count queries on the replica too
+                        captured = [
+                            stack.enter_context(
+                                CaptureQueriesContext(connections[alias]))
+                            for alias in connections
+                        ]
+                        start = time.perf_counter()
+                        response = self.request(
+                            client, operation, listing_id, categories,
+                            first_page_end)
+                        elapsed = time.perf_counter() - start
+                    queries = sum(len(queries) for queries in captured)
+                    measured[operation].append(
+                        (elapsed, queries, response.status_code >= 400))
+            finally:
+                for alias in connections:
+                    connections[alias].close()
+            with lock:
+                for operation, values in measured.items():
+                    samples[operation].extend(values)
+
+        per_thread = math.ceil(options["requests"] / options["threads"])
+        threads = [threading.Thread(target=run, args=(per_thread,))
+                   for _ in range(options["threads"])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        views = {operation: summarize(values, wall)
+                 for operation, values in sorted(samples.items())}
+        everything = [value for values in samples.values()
+                      for value in values]
+        return {"views": views, "total": summarize(everything, wall),
+                "wall_seconds": wall}
+
+    def request(self, client, operation, listing_id, categories,
+                first_page_end):
+        listing_url = reverse("listing", args=[listing_id])
+        if operation == "index":
+            return client.get(reverse("index"))
+        if operation == "index_next_page":
+            return client.get(reverse("index") + f"?cursor=a{first_page_end}")
+        if operation == "listing":
+            return client.get(listing_url)
+        if operation == "categories":
+            return client.get(reverse("categories"))
+        if operation == "category":
+            return client.get(
+                reverse("category", args=[random.choice(categories)]))
+        if operation == "search":
+            return client.get(reverse("search"),
+                              {"q": " ".join(random.sample(WORDS, 2))})
+        if operation == "watchlist":
+            return client.get(reverse("watchlist"))
+        if operation == "bid":
+            listing = Listing.objects.values("current_bid").get(
+                id=listing_id)
+            return client.post(listing_url, {
+                "bid": listing["current_bid"] + random.randint(1, 50)})
+        if operation == "comment":
+            return client.post(listing_url, {"comment": sentence(8)})
+        return client.post(reverse("add_to_watchlist"), {
+            "add-to-watchlist": listing_id, "page": "listing"})
+
+    def report(self, results, previous):
+        self.stdout.write(
+            f"{'view':<18}{'requests':>9}{'rps':>9}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+        rows = list(results["views"].items()) + [("total", results["total"])]
+        for name, stats in rows:
+            line = (f"{name:<18}{stats['requests']:>9}{stats['rps']:>9.1f}"
+                    f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+                    f"{stats['p99_ms']:>9.1f}{stats['mean_queries']:>9.1f}"
+                    f"{stats['errors']:>8}")
+            before = (previous["total"] if name == "total" else
+                      previous["views"].get(name)) if previous else None
+            if before:
+                line += (f"   p95 {stats['p95_ms'] - before['p95_ms']:+.1f} "
+                         f"ms, rps {stats['rps'] - before['rps']:+.1f}")
+            self.stdout.write(line)
+
+
+@contextmanager
+def untuned():
+    # Plain SQLite connections, opened per request, all on the primary
+    max_ages = {alias: connections[alias].settings_dict["CONN_MAX_AGE"]
+                for alias in connections}
+    for alias in connections:
+        connections[alias].settings_dict["CONN_MAX_AGE"] = 0
+    try:
+        with override_settings(SQLITE_PRAGMAS={}, DATABASE_ROUTERS=[]):
+            yield
+    finally:
+        for alias, max_age in max_ages.items():
+            connections[alias].settings_dict["CONN_MAX_AGE"] = max_age
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(samples, wall):
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+    if not latencies:
+        latencies = [0.0]
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / wall,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_queries": (sum(queries for _, queries, _ in samples) /
+                         len(samples)) if samples else 0.0,
+        "errors": sum(error for _, _, error in samples),
+    }
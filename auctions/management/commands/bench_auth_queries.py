@@ -0,0 +1,74 @@
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from auctions.models import Watchlist
+from ._seed import PASSWORD, seed
+from ._testdb import throwaway_database
+
+# Session and auth settings before auctions.auth
+BASELINE = {
+    "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+    "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+}
+
+
+class Command(BaseCommand):
+    help = ("Count the queries of authenticated requests with database "
+            "sessions and uncached users, then with the configured session "
+            "engine and auth backend, in a throwaway database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20,
+                            help="Requests per page, averaged.")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            seed(users=5, listings=50, bids=200, comments=50, watchlists=20)
+            watch = Watchlist.objects.values_list(
+                "user__username", "listing_id").first()
+            pages = {
+                "index": reverse("index"),
+                "listing": reverse("listing", kwargs={"id": watch[1]}),
+                "watchlist": reverse("watchlist"),
+                "categories": reverse("categories"),
+                "create_listing": reverse("create_listing"),
+            }
+
+            with override_settings(**BASELINE):
+                before = self.count(watch[0], pages, options["requests"])
+            after = self.count(watch[0], pages, options["requests"])
+
+        for page, queries in before.items():
+            self.stdout.write(
+                f"{page}: {queries:.1f} -> {after[page]:.1f} queries "
+                f"per request")
+        total_before, total_after = sum(before.values()), sum(after.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"All pages: {total_before / len(before):.1f} -> "
+            f"{total_after / len(after):.1f} queries per request"))
+
+    def count(self, username, pages, requests):
+        cache.clear()
+        client = Client()
+        client.login(username=username, password=PASSWORD)
+        counts = {}
+        for page, path in pages.items():
+            total = 0
+            for _ in range(requests):
+                with ExitStack() as stack:
+                    # Count queries on the replica too
+                    captured = [
+                        stack.enter_context(
+                            CaptureQueriesContext(connections[alias]))
+                        for alias in connections
+                    ]
+                    client.get(path)
+                total += sum(len(queries) for queries in captured)
+            counts[page] = total / requests
+        return counts
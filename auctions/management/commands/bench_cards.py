@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.template import Engine, engines
+
+from auctions.cards import CARD_TEMPLATE, render_card_fast, render_card_template
+from ._seed import sentence
+
+
+class Command(BaseCommand):
+    help = ("Time rendering listing cards through the template engine, "
+            "without and with the cached loader, and through the string "
+            "formatting fast path.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, nargs="+",
+                            default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Runs per measurement; the fastest is kept.")
+
+    def handle(self, *args, **options):
+        backend = engines["django"]
+        # The configured engine, minus the cached loader
+        uncached = Engine(libraries=backend.engine.libraries, loaders=[
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ])
+        grid = backend.from_string(
+            "{% for listing in listings %}"
+            "<li>{% include '" + CARD_TEMPLATE + "' %}</li>"
+            "{% endfor %}")
+
+        renderers = {
+            "uncached loader": lambda listings: [
+                uncached.render_to_string(CARD_TEMPLATE, {"listing": listing})
+                for listing in listings],
+            "cached loader": lambda listings: [
+                render_card_template(listing) for listing in listings],
+            "grid include": lambda listings: grid.render(
+                {"listings": listings}),
+            "fast path": lambda listings: [
+                render_card_fast(listing) for listing in listings],
+        }
+
+        for count in options["cards"]:
+            listings = self.listings(count)
+            baseline = None
+            for name, render in renderers.items():
+                seconds = min(self.time(render, listings)
+                              for _ in range(options["repeat"]))
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f"{count} cards, {name}: {seconds * 1000:.1f} ms "
+                    f"({seconds / count * 1e6:.1f} us/card, "
+                    f"{baseline / seconds:.1f}x)")
+
+    def listings(self, count):
+        return [{
+            "id": i,
+            "title": sentence(3),
+            "description": sentence(30) + " <&>",
+            "image_url": f"https://example.com/{i}.jpg" if i % 2 else "",
+            "current_bid": random.randint(1, 100000),
+        } for i in range(1, count + 1)]
+
+    def time(self, render, listings):
+        start = time.perf_counter()
+        render(listings)
+        return time.perf_counter() - start
@@ -0,0 +1,100 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from auctions.models import User, Category, Listing, Watchlist, Bid
+from ._testdb import throwaway_database
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database with many listings and bids and check "
+            "that the grid pages run a constant number of queries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=10000)
+        parser.add_argument("--bids", type=int, default=500000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run_benchmark(options)
+
+    def run_benchmark(self, options):
+        user = User.objects.create_user("bench", "bench@example.com", "bench")
+        category = Category.objects.create(name="Bench")
+        client = Client()
+        client.force_login(user)
+
+        # Measure with a handful of rows, then again at full scale
+        self.seed(user, category, 10, 100, options["batch_size"])
+        small = self.count_queries(client, category)
+
+        self.seed(user, category, options["listings"], options["bids"],
+                  options["batch_size"])
+        large = self.count_queries(client, category)
+
+        failed = False
+        for page, (queries, seconds) in large.items():
+            self.stdout.write(
+                f"{page}: {queries} queries ({small[page][0]} with 10 "
+                f"listings), {seconds * 1000:.1f} ms")
+            if queries != small[page][0]:
+                failed = True
+
+        if failed:
+            raise CommandError("Query count grows with the number of listings.")
+        self.stdout.write(self.style.SUCCESS("Query counts are constant."))
+
+    def seed(self, user, category, listings, bids, batch_size):
+        first = Listing.objects.count()
+        Listing.objects.bulk_create((
+            Listing(seller=user, category=category, title=f"Listing {i}",
+                    description="Benchmark listing", starting_bid=1,
+                    current_bid=1, active=True)
+            for i in range(first, first + listings)
+        ), batch_size=batch_size)
+        ids = list(Listing.objects.order_by("id")
+                   .values_list("id", flat=True)[first:])
+
+        Bid.objects.bulk_create((
+            Bid(item_id=random.choice(ids), bidder=user,
+                bid_ammount=random.randint(1, 100000))
+            for _ in range(bids)
+        ), batch_size=batch_size)
+        Listing.objects.filter(id__gte=ids[0]).rebuild_bid_stats()
+        Watchlist.objects.bulk_create((
+            Watchlist(user=user, listing_id=listing_id)
+            for listing_id in ids[:100]
+        ), batch_size=batch_size)
+
+    def count_queries(self, client, category):
+        pages = {
+            "index": reverse("index"),
+            "category": reverse("category", args=[category.name]),
+            "watchlist": reverse("watchlist"),
+        }
+        results = {}
+        for page, url in pages.items():
+            # Leave out one-off work, such as loading the leaderboards
+            client.get(url)
+            with ExitStack() as stack:
+                # Count queries on the replica too
+                captured = [
+                    stack.enter_context(
+                        CaptureQueriesContext(connections[alias]))
+                    for alias in connections
+                ]
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+            results[page] = (sum(len(queries) for queries in captured),
+                             elapsed)
+        return results
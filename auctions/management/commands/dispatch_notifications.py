@@ -0,0 +1,39 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from auctions.notifications import Dispatcher, notification_stats
+
+
+class Command(BaseCommand):
+    help = ("Send the notifications of outbid and closed auctions waiting "
+            "in the outbox, continuously or once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Empty the outbox and exit.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds between checks of an empty outbox.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--max-in-flight", type=int, default=100)
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(batch_size=options["batch_size"],
+                                workers=options["workers"],
+                                max_in_flight=options["max_in_flight"])
+        if options["once"]:
+            while dispatcher.tick():
+                pass
+            stats = notification_stats()
+            self.stdout.write(
+                f"Dispatched {stats['events']} events as {stats['messages']} "
+                f"messages ({stats['messages_per_second'] or 0:.0f}/s), "
+                f"{stats['failures']} failed.")
+            return
+
+        stop = threading.Event()
+        try:
+            dispatcher.run(stop, options["interval"])
+        except KeyboardInterrupt:
+            pass
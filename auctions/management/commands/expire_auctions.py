@@ -0,0 +1,36 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from auctions.expiry import ExpiryScheduler
+
+
+class Command(BaseCommand):
+    help = "Close auctions whose end time has passed, continuously or once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Close what is due now and exit.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds between ticks.")
+        parser.add_argument("--horizon", type=int, default=10,
+                            help="Seconds ahead loaded into the schedule.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        scheduler = ExpiryScheduler(horizon=options["horizon"],
+                                    batch_size=options["batch_size"])
+        if options["once"]:
+            closed = scheduler.tick()
+            self.stdout.write(f"Closed {closed} auctions.")
+            return
+
+        stop = threading.Event()
+        try:
+            while not stop.is_set():
+                closed = scheduler.safe_tick()
+                if closed:
+                    self.stdout.write(f"Closed {closed} auctions.")
+                stop.wait(options["interval"])
+        except KeyboardInterrupt:
+            pass
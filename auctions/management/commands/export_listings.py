@@ -0,0 +1,41 @@
+import heapq
+
+from django.core.management.base import BaseCommand
+
+from auctions.models import Listing, ListingArchive, Bid, ArchivedBid
+from ._records import FIELDS, guess_format, open_stream, write_records
+
+
+class Command(BaseCommand):
+    help = ("Stream every listing, or every bid, archived ones included, to "
+            "a JSONL or CSV file in constant memory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="File to write, or - for stdout.")
+        parser.add_argument("--kind", choices=FIELDS, default="listings")
+        parser.add_argument("--format", choices=["jsonl", "csv"],
+                            help="Defaults to the output file's extension.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["kind"] == "listings":
+            rows = Listing.objects.order_by("id").values_list(
+                "id", "seller__username", "title", "description",
+                "category__name", "image_url", "starting_bid", "current_bid",
+                "bid_count", "active", "ends_at", "closed_at").iterator(
+                chunk_size=options["chunk_size"])
+        else:
+            rows = Bid.objects.order_by("id").values_list(
+                "id", "item_id", "bidder__username", "bid_ammount",
+                "created").iterator(chunk_size=options["chunk_size"])
+            # Archived bids kept their ids, so the two merge in id order.
+            # The archive isn't read until something was archived.
+            if ListingArchive.objects.exists():
+                rows = heapq.merge(
+                    rows, ArchivedBid.objects.order_by("id").values_list(
+                        "id", "item_id", "bidder_name", "bid_ammount",
+                        "created").iterator(chunk_size=options["chunk_size"]))
+
+        fmt = guess_format(options["output"], options["format"])
+        with open_stream(options["output"], "w") as stream:
+            write_records(stream, fmt, FIELDS[options["kind"]], rows)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the current_bid, bid_count and highest_bidder columns "
+            "of every listing from the Bid table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report listings whose columns are out of date.")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            stale = Listing.objects.stale_bid_stats()
+            ids = list(stale.values_list("id", flat=True)[:20])
+            count = stale.count()
+            if count:
+                raise CommandError(
+                    f"{count} listings have stale bid stats, e.g. {ids}.")
+            self.stdout.write(self.style.SUCCESS("Bid stats are up to date."))
+            return
+
+        count = Listing.objects.rebuild_bid_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt bid stats for {count} listings."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from auctions.stats import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = ("Recompute the listing count and price summary of every "
+            "category, e.g. after listings were written without signals.")
+
+    def handle(self, *args, **options):
+        count = rebuild_category_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the stats of {count} categories."))
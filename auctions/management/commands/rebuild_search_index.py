@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from auctions.search import rebuild_index, fts_available
+
+
+class Command(BaseCommand):
+    help = ("Reindex the title and description of every listing, e.g. after "
+            "listings were written without signals by bulk_create.")
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(
+                "No FTS5 table: each process builds its in-memory search "
+                "index from the database when it first searches.")
+            return
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from auctions.bidding import BidError, place_bid
+from auctions.models import User, Category, CategoryStats, Listing, Bid
+from auctions.stats import category_summary
+from ._testdb import throwaway_database
+
+
+class Command(BaseCommand):
+    help = ("Hammer a few listings with concurrent bids from many threads, "
+            "then check that every listing has exactly one consistent winner "
+            "and the category summary matches the listings.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--bids", type=int, default=200,
+                            help="Bids attempted by each thread.")
+        parser.add_argument("--listings", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with throwaway_database(on_disk=True):
+            self.run_stress(options)
+
+    def run_stress(self, options):
+        seller = User.objects.create_user("seller")
+        category = Category.objects.create(name="Stress")
+        bidders = [User.objects.create_user(f"bidder{i}")
+                   for i in range(options["threads"])]
+        listings = [
+            Listing.objects.create(
+                seller=seller, category=category, title=f"Listing {i}",
+                description="Stress listing", starting_bid=1, active=True)
+            for i in range(options["listings"])
+        ]
+        # Threads open their own connections to the same database file
+        connection.close()
+
+        counts = {"placed": 0, "rejected": 0, "failed": 0}
+        lock = threading.Lock()
+
+        def bid_loop(bidder):
+            placed = rejected = failed = 0
+            try:
+                for _ in range(options["bids"]):
+                    listing = Listing.objects.get(
+                        id=random.choice(listings).id)
+                    try:
+                        place_bid(listing, bidder,
+                                  listing.current_bid + random.randint(0, 3))
+                        placed += 1
+                    except BidError:
+                        rejected += 1
+                    except OperationalError:
+                        failed += 1
+            finally:
+                connection.close()
+            with lock:
+                counts["placed"] += placed
+                counts["rejected"] += rejected
+                counts["failed"] += failed
+
+        threads = [threading.Thread(target=bid_loop, args=(bidder,))
+                   for bidder in bidders]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        attempted = options["threads"] * options["bids"]
+        self.stdout.write(
+            f"{attempted} bids attempted in {elapsed:.2f} s "
+            f"({attempted / elapsed:.0f} bids/sec): {counts['placed']} "
+            f"placed, {counts['rejected']} rejected, {counts['failed']} "
+            f"failed on lock contention.")
+
+        errors = self.check_listings(listings)
+        stats = CategoryStats.objects.filter(category=category).values(
+            *category_summary(category.id)).first()
+        if stats != category_summary(category.id):
+            errors.append(f"category summary {stats} is out of date")
+        if Bid.objects.count() != counts["placed"]:
+            errors.append(f"{Bid.objects.count()} Bid rows for "
+                          f"{counts['placed']} placed bids")
+        if errors:
+            raise CommandError("Inconsistent bids: " + "; ".join(errors))
+        self.stdout.write(self.style.SUCCESS("All listings are consistent."))
+
+    def check_listings(self, listings):
+        errors = []
+        for listing in Listing.objects.filter(
+                id__in=[listing.id for listing in listings]):
+            amounts = list(listing.bids.order_by("id").values_list(
+                "bid_ammount", "bidder"))
+
+            # Every accepted bid must beat the one accepted before it
+            for (previous, _), (amount, _) in zip(amounts, amounts[1:]):
+                if amount <= previous:
+                    errors.append(f"listing {listing.id} accepted ${amount} "
+                                  f"after ${previous}")
+                    break
+
+            if amounts:
+                winning_bid, winner = amounts[-1]
+                if (listing.current_bid, listing.highest_bidder_id) != \
+                        (winning_bid, winner):
+                    errors.append(f"listing {listing.id} shows "
+                                  f"${listing.current_bid} but the "
+                                  f"winning bid is ${winning_bid}")
+            if listing.bid_count != len(amounts):
+                errors.append(f"listing {listing.id} counts "
+                              f"{listing.bid_count} bids, has {len(amounts)}")
+        return errors
@@ -0,0 +1,274 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import mimetypes
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.template.backends.django import Template
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in ms, of the wall time histogram buckets
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Seconds browsers may keep static files without a hash in their name
+STATIC_MAX_AGE = 60
+
+# Precompressed variants, in order of preference
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Counters of the request being handled, if any
+_current = contextvars.ContextVar("perf_current", default=None)
+
+_lock = threading.Lock()
+_views = defaultdict(lambda: {
+    "requests": 0,
+    "queries": 0,
+    "db_ms": 0.0,
+    "template_ms": 0.0,
+    "wall_ms": 0.0,
+    "max_wall_ms": 0.0,
+    "max_queries": 0,
+    "n_plus_one_warnings": 0,
+    "histogram": [0] * (len(BUCKETS) + 1),
+})
+_profiles = deque(maxlen=20)
+
+
+def _render_timed(render):
+    def wrapper(self, *args, **kwargs):
+        current = _current.get()
+        if current is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            current["template"] += time.perf_counter() - start
+    wrapper.perf_timed = True
+    return wrapper
+
+
+def perf_stats():
+    # Per-view totals and histograms of this process since it started
+    with _lock:
+        views = {}
+        for view, stats in _views.items():
+            requests = stats["requests"]
+            views[view] = dict(
+                stats,
+                histogram=dict(zip(
+                    [f"<={bound}ms" for bound in BUCKETS] + ["slower"],
+                    stats["histogram"])),
+                mean_queries=stats["queries"] / requests,
+                mean_db_ms=stats["db_ms"] / requests,
+                mean_template_ms=stats["template_ms"] / requests,
+                mean_wall_ms=stats["wall_ms"] / requests)
+        return {"views": views, "profiles": list(_profiles)}
+
+
+class PerformanceMiddleware:
+    """
+    Record the query count, database time, template render time and wall
+    time of every request by view, warn about requests running more than
+    PERF_QUERY_WARNING queries, and keep cProfile output of a sample
+    (PERF_PROFILE_RATE) of the requests slower than PERF_SLOW_MS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_warning = getattr(settings, "PERF_QUERY_WARNING", 20)
+        self.profile_rate = getattr(settings, "PERF_PROFILE_RATE", 0.0)
+        self.slow_ms = getattr(settings, "PERF_SLOW_MS", 500)
+        if not getattr(Template.render, "perf_timed", False):
+            Template.render = _render_timed(Template.render)
+
+    def __call__(self, request):
+        current = {"queries": 0, "db": 0.0, "template": 0.0}
+        token = _current.set(current)
+        profiler = None
+        if self.profile_rate and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # read_only views query the replica, not the default alias
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(self.time_query))
+                if profiler:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        if match:
+            view = match.view_name
+        elif request.path_info.startswith(settings.STATIC_URL):
+            view = "static"
+        else:
+            view = "unresolved"
+        self.record(view, current, wall_ms)
+
+        if current["queries"] > self.query_warning:
+            logger.warning(
+                "%s ran %d queries for %s, possibly an N+1 pattern.",
+                view, current["queries"], request.path)
+        if profiler and wall_ms >= self.slow_ms:
+            self.keep_profile(profiler, request, view, wall_ms)
+        return response
+
+    def time_query(self, execute, sql, params, many, context):
+        current = _current.get()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if current is not None:
+                current["queries"] += 1
+                current["db"] += time.perf_counter() - start
+
+    def record(self, view, current, wall_ms):
+        with _lock:
+            stats = _views[view]
+            stats["requests"] += 1
+            stats["queries"] += current["queries"]
+            stats["db_ms"] += current["db"] * 1000
+            stats["template_ms"] += current["template"] * 1000
+            stats["wall_ms"] += wall_ms
+            stats["max_wall_ms"] = max(stats["max_wall_ms"], wall_ms)
+            stats["max_queries"] = max(stats["max_queries"],
+                                       current["queries"])
+            if current["queries"] > self.query_warning:
+                stats["n_plus_one_warnings"] += 1
+            stats["histogram"][bisect_left(BUCKETS, wall_ms)] += 1
+
+    def keep_profile(self, profiler, request, view, wall_ms):
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats(
+            "cumulative").print_stats(30)
+        with _lock:
+            _profiles.append({
+                "view": view,
+                "path": request.get_full_path(),
+                "wall_ms": wall_ms,
+                "time": time.time(),
+                "stats": output.getvalue(),
+            })
+
+
+def _accepted_encodings(header):
+    # Content codings of an Accept-Encoding header, less those with q=0
+    encodings = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        if not re.fullmatch(r"\s*q=0(\.0*)?\s*", params):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+class StaticAssetMiddleware:
+    """
+    Serve the files collectstatic put in STATIC_ROOT, picking the brotli or
+    gzip variant written by CompressedManifestStaticFilesStorage when the
+    browser accepts it. Files with a content hash in their name never
+    change, so they are cached for a year without revalidation. The
+    directory is indexed once, when the process starts, so a request
+    costs a dict lookup and no stat calls.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = {}
+        root = settings.STATIC_ROOT
+        # Files on another host, or not collected: leave them to others
+        if self.prefix.startswith("/") and root and os.path.isdir(root):
+            self.files = self.index(root)
+
+    def index(self, root):
+        try:
+            with open(os.path.join(root, "staticfiles.json")) as f:
+                hashed = set(json.load(f)["paths"].values())
+        except (OSError, ValueError, KeyError):
+            hashed = set()
+        files = {}
+        for directory, _, names in os.walk(root):
+            for filename in names:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, "/")
+                if name.endswith((".gz", ".br")) and \
+                        os.path.exists(path[:-3]):
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or \
+                    "application/octet-stream"
+                if content_type.startswith("text/") or \
+                        content_type == "application/javascript":
+                    content_type += "; charset=utf-8"
+                stat = os.stat(path)
+                files[name] = {
+                    "path": path,
+                    "content_type": content_type,
+                    "mtime": stat.st_mtime,
+                    "cache_control":
+                        "public, max-age=31536000, immutable"
+                        if name in hashed
+                        else f"public, max-age={STATIC_MAX_AGE}",
+                    "variants": [(encoding, path + suffix)
+                                 for encoding, suffix in STATIC_ENCODINGS
+                                 if os.path.exists(path + suffix)],
+                }
+        return files
+
+    def __call__(self, request):
+        path = request.path_info
+        if not self.files or not path.startswith(self.prefix) or \
+                request.method not in ("GET", "HEAD"):
+            return self.get_response(request)
+        file = self.files.get(path[len(self.prefix):])
+        if file is None:
+            return self.get_response(request)
+
+        if not was_modified_since(
+                request.META.get("HTTP_IF_MODIFIED_SINCE"), file["mtime"]):
+            response = HttpResponseNotModified()
+        else:
+            served, encoding = file["path"], None
+            accepted = _accepted_encodings(
+                request.META.get("HTTP_ACCEPT_ENCODING", ""))
+            for variant_encoding, variant_path in file["variants"]:
+                if variant_encoding in accepted:
+                    served, encoding = variant_path, variant_encoding
+                    break
+            if request.method == "HEAD":
+                response = HttpResponse(content_type=file["content_type"])
+                response["Content-Length"] = os.path.getsize(served)
+            else:
+                response = FileResponse(open(served, "rb"),
+                                        content_type=file["content_type"])
+            if encoding:
+                response["Content-Encoding"] = encoding
+            response["Last-Modified"] = http_date(file["mtime"])
+        response["Cache-Control"] = file["cache_control"]
+        if file["variants"]:
+            response["Vary"] = "Accept-Encoding"
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    bids = Bid.objects.filter(item=OuterRef('pk'))
+    Listing.objects.update(
+        current_bid=Coalesce(Subquery(
+            bids.order_by('-bid_ammount').values('bid_ammount')[:1]),
+            F('starting_bid')),
+        bid_count=Coalesce(Subquery(
+            bids.order_by().values('item').annotate(
+                count=Count('id')).values('count')), 0),
+        highest_bidder=Subquery(
+            bids.order_by('-bid_ammount', 'id').values('bidder')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0002_rename_available_listing_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_bid',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='highest_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_bid_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:24
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+
+    # Merge categories sharing a name into the oldest one
+    names = (Category.objects.values('name')
+             .annotate(keep=Min('id'), count=Count('id'))
+             .filter(count__gt=1))
+    for duplicate in names:
+        extra = Category.objects.filter(
+            name=duplicate['name']).exclude(id=duplicate['keep'])
+        Listing.objects.filter(category__in=extra).update(
+            category_id=duplicate['keep'])
+        extra.delete()
+
+    # Keep one watchlist row per user and listing
+    keep = (Watchlist.objects.values('user', 'listing')
+            .annotate(keep=Min('id')).values('keep'))
+    Watchlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0003_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['item', '-bid_ammount'], name='bid_item_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['id'], name='listing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['category', 'id'], name='listing_active_category_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='unique_watchlist_item'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:40
+
+from django.db import migrations, OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    # Without SQLite FTS5, auctions.search falls back to an in-memory index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE auctions_listing_fts '
+            'USING fts5(title, description)')
+    except OperationalError:
+        return
+    schema_editor.execute(
+        'INSERT INTO auctions_listing_fts (rowid, title, description) '
+        'SELECT id, title, description FROM auctions_listing')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS auctions_listing_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
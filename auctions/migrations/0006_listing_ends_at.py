@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def fill_winners(apps, schema_editor):
+    # Auctions closed so far were won by their highest bidder
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.filter(active=False).update(winner=F('highest_bidder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0005_listing_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ends_at'], name='listing_active_ends_idx'),
+        ),
+        migrations.RunPython(fill_winners, migrations.RunPython.noop),
+    ]
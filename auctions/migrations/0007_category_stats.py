@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    CategoryStats = apps.get_model('auctions', 'CategoryStats')
+    Listing = apps.get_model('auctions', 'Listing')
+    stats = []
+    for category_id in Category.objects.values_list('id', flat=True):
+        listings = Listing.objects.filter(active=True, category_id=category_id)
+        summary = listings.aggregate(
+            active_count=Count('id'), min_bid=Min('current_bid'),
+            max_bid=Max('current_bid'))
+        count = summary['active_count']
+        summary['median_bid'] = listings.order_by('current_bid').values_list(
+            'current_bid', flat=True)[(count - 1) // 2] if count else None
+        stats.append(CategoryStats(category_id=category_id, **summary))
+    CategoryStats.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auctions.category')),
+                ('active_count', models.PositiveIntegerField(default=0)),
+                ('min_bid', models.PositiveIntegerField(null=True)),
+                ('max_bid', models.PositiveIntegerField(null=True)),
+                ('median_bid', models.PositiveIntegerField(null=True)),
+                ('last_activity', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['category', 'current_bid'], name='listing_active_cat_bid_idx'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_category_stats'),
+    ]
+
+    operations = [
+        # Added without a default first, so existing bids stay unknown
+        # rather than all getting the time of the migration
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:18
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_closed_at(apps, schema_editor):
+    # Auctions closed so far closed when they ended, or at the latest now
+    Listing = apps.get_model('auctions', 'Listing')
+    now = django.utils.timezone.now()
+    closed = Listing.objects.filter(active=False)
+    closed.filter(ends_at__lte=now).update(closed_at=F('ends_at'))
+    closed.filter(closed_at__isnull=True).update(closed_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('item_id', models.IntegerField()),
+                ('bid_ammount', models.PositiveIntegerField()),
+                ('bidder_id', models.IntegerField()),
+                ('bidder_name', models.CharField(max_length=150)),
+                ('created', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('listing_id', models.IntegerField()),
+                ('comment', models.TextField(max_length=280)),
+                ('user_id', models.IntegerField()),
+                ('user_name', models.CharField(max_length=150)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingArchive',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='auctions.listing')),
+                ('bid_count', models.PositiveIntegerField()),
+                ('comment_count', models.PositiveIntegerField()),
+                ('first_bid', models.DateTimeField(null=True)),
+                ('last_bid', models.DateTimeField(null=True)),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', False)), fields=['closed_at'], name='listing_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['listing_id'], name='archived_comment_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbid',
+            index=models.Index(fields=['item_id'], name='archived_bid_item_idx'),
+        ),
+        migrations.RunPython(fill_closed_at, migrations.RunPython.noop),
+    ]
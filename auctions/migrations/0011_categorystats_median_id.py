@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def fill_median_id(apps, schema_editor):
+    CategoryStats = apps.get_model('auctions', 'CategoryStats')
+    Listing = apps.get_model('auctions', 'Listing')
+    for stats in CategoryStats.objects.filter(active_count__gt=0):
+        listings = Listing.objects.filter(
+            active=True, category_id=stats.category_id)
+        count = listings.count()
+        stats.active_count = count
+        stats.median_bid, stats.median_id = listings.order_by(
+            'current_bid', 'id').values_list(
+            'current_bid', 'id')[(count - 1) // 2] if count else (None, None)
+        stats.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorystats',
+            name='median_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_median_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_categorystats_median_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='claimed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='claimed_by',
+            field=models.UUIDField(null=True),
+        ),
+    ]
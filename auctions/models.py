@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -7,12 +10,69 @@ class User(AbstractUser):
 
 
 class Category(models.Model):
-    name = models.CharField(max_length=64)
+    name = models.CharField(max_length=64, unique=True)
 
     def __str__(self):
         return f"{self.name}"
 
 
+class CategoryStats(models.Model):
+    # Summary of a category's active listings, kept by auctions.stats
+    category = models.OneToOneField(
+        Category, on_delete=models.CASCADE, primary_key=True,
+        related_name="stats")
+    active_count = models.PositiveIntegerField(default=0)
+    min_bid = models.PositiveIntegerField(null=True)
+    max_bid = models.PositiveIntegerField(null=True)
+    # Lower median when the count is even, and the listing holding it, ties
+    # broken by id, for auctions.stats to move it from one change to the next
+    median_bid = models.PositiveIntegerField(null=True)
+    median_id = models.PositiveIntegerField(null=True)
+    # Last time a listing or bid of the category changed
+    last_activity = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.category_id}: {self.active_count} active listings"
+
+
+def _bid_stats():
+    # Bid-derived values of the denormalized columns, as subqueries
+    bids = Bid.objects.filter(item=OuterRef("pk"))
+    return {
+        "current_bid": Coalesce(Subquery(
+            bids.order_by("-bid_ammount").values("bid_ammount")[:1]),
+            F("starting_bid")),
+        "bid_count": Coalesce(Subquery(
+            bids.order_by().values("item").annotate(
+                count=Count("id")).values("count")), 0),
+        "highest_bidder": Subquery(
+            bids.order_by("-bid_ammount", "id").values("bidder")[:1]),
+    }
+
+
+class ListingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(active=True)
+
+    def rebuild_bid_stats(self):
+        # Recompute the denormalized bid columns from the Bid table. Archived
+        # listings keep theirs, as their bids aren't in it any more.
+        return self.filter(archive__isnull=True).update(**_bid_stats())
+
+    def stale_bid_stats(self):
+        # Listings whose denormalized bid columns disagree with the Bid table
+        stats = _bid_stats()
+        return self.filter(archive__isnull=True).annotate(
+            real_current_bid=stats["current_bid"],
+            real_bid_count=stats["bid_count"],
+            real_highest_bidder=stats["highest_bidder"],
+        ).exclude(
+            Q(current_bid=F("real_current_bid")),
+            Q(bid_count=F("real_bid_count")),
+            Q(highest_bidder=F("real_highest_bidder")) |
+            Q(highest_bidder__isnull=True, real_highest_bidder__isnull=True))
+
+
 class Listing(models.Model):
     seller = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="listings")
@@ -23,10 +83,66 @@ class Listing(models.Model):
     image_url = models.URLField(blank=True)
     starting_bid = models.PositiveIntegerField()
     active = models.BooleanField()
+    # Closed by the expire_auctions worker once passed, if set
+    ends_at = models.DateTimeField(null=True, blank=True)
+    winner = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="won_listings")
+    # Set when the auction closes; auctions.archive goes by it
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    # Denormalized from Bid, kept in sync by bidding.place_bid
+    current_bid = models.PositiveIntegerField(default=0)
+    bid_count = models.PositiveIntegerField(default=0)
+    highest_bidder = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="+")
+    # Bumped with every write that changes what the API shows of the
+    # listing, in the same UPDATE or transaction; its ETags go by it
+    version = models.PositiveIntegerField(default=0)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Grid pages: active listings, overall or by category, by id
+            models.Index(fields=["id"], condition=Q(active=True),
+                         name="listing_active_idx"),
+            models.Index(fields=["category", "id"], condition=Q(active=True),
+                         name="listing_active_category_idx"),
+            # Category stats: active listings of a category by price
+            models.Index(fields=["category", "current_bid"],
+                         condition=Q(active=True),
+                         name="listing_active_cat_bid_idx"),
+            # Expiry worker: active listings by end time
+            models.Index(fields=["ends_at"], condition=Q(active=True),
+                         name="listing_active_ends_idx"),
+            # Archiver: closed listings by close time
+            models.Index(fields=["closed_at"], condition=Q(active=False),
+                         name="listing_closed_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} | User: {self.seller.username}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.bid_count:
+            self.current_bid = self.starting_bid
+        if not self.active and self.closed_at is None:
+            self.closed_at = timezone.now()
+        bumped = not self._state.adding
+        if bumped:
+            # Incremented by the UPDATE, whatever version was loaded
+            self.version = F("version") + 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"],
+                                           "version"}
+        # Along with the category summaries its signals update
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=["version"])
+
 
 class Watchlist(models.Model):
     listing = models.ForeignKey(
@@ -34,6 +150,12 @@ class Watchlist(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="watchlist")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "listing"],
+                                    name="unique_watchlist_item"),
+        ]
+
     def __str__(self):
         return f"{self.listing.title} being watched by {self.user.username}"
 
@@ -48,6 +170,11 @@ class Comment(models.Model):
     def __str__(self):
         return f"Comment by {self.user.username} in {self.listing.title}"
 
+    def save(self, *args, **kwargs):
+        # Along with the listing's version, bumped by its signals
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Bid(models.Model):
     item = models.ForeignKey(
@@ -55,6 +182,102 @@ class Bid(models.Model):
     bid_ammount = models.PositiveIntegerField()
     bidder = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="bids")
+    # Unknown for bids placed before it was added
+    created = models.DateTimeField(default=timezone.now, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["item", "-bid_ammount"],
+                         name="bid_item_amount_idx"),
+        ]
 
     def __str__(self):
         return f"{self.item.title} | Bid: ${self.bid_ammount} | User: {self.bidder.username}"
+
+
+class OutboxEvent(models.Model):
+    # Listing events waiting to be fanned out by auctions.notifications
+    OUTBID = "outbid"
+    CLOSED = "closed"
+    KINDS = [(OUTBID, "Outbid"), (CLOSED, "Closed")]
+
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=16, choices=KINDS)
+    # The new bid, or the winning one
+    amount = models.PositiveIntegerField()
+    # The new bidder, or the winner
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name="+")
+    created = models.DateTimeField(default=timezone.now)
+    # The dispatcher sending the event, so that no other one sends it too
+    claimed_by = models.UUIDField(null=True)
+    claimed_at = models.DateTimeField(null=True)
+    dispatched = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=Q(dispatched__isnull=True),
+                         name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.listing_id} ${self.amount}"
+
+
+class ListingArchive(models.Model):
+    # Left behind by auctions.archive when it moves a closed listing's bids
+    # and comments to ArchivedBid and ArchivedComment
+    listing = models.OneToOneField(
+        Listing, on_delete=models.CASCADE, primary_key=True,
+        related_name="archive")
+    bid_count = models.PositiveIntegerField()
+    comment_count = models.PositiveIntegerField()
+    first_bid = models.DateTimeField(null=True)
+    last_bid = models.DateTimeField(null=True)
+    archived = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return (f"{self.listing_id}: {self.bid_count} bids, "
+                f"{self.comment_count} comments archived")
+
+
+class ArchivedBid(models.Model):
+    """
+    A bid of an archived listing, under its original id. It may be stored
+    in an archive database of its own (see auctions.db.ArchiveRouter), so
+    it refers to the listing and the bidder by id only, and keeps the
+    bidder's username for reading without a join.
+    """
+    id = models.IntegerField(primary_key=True)
+    item_id = models.IntegerField()
+    bid_ammount = models.PositiveIntegerField()
+    bidder_id = models.IntegerField()
+    bidder_name = models.CharField(max_length=150)
+    created = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["item_id"], name="archived_bid_item_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} | Bid: ${self.bid_ammount} | User: {self.bidder_name}"
+
+
+class ArchivedComment(models.Model):
+    # A comment of an archived listing, stored like ArchivedBid
+    id = models.IntegerField(primary_key=True)
+    listing_id = models.IntegerField()
+    comment = models.TextField(max_length=280)
+    user_id = models.IntegerField()
+    user_name = models.CharField(max_length=150)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing_id"],
+                         name="archived_comment_listing_idx"),
+        ]
+
+    def __str__(self):
+        return f"Comment by {self.user_name} in {self.listing_id}"
@@ -0,0 +1,271 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import Case, IntegerField, OuterRef, Q, Subquery, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import User, Listing, Watchlist, Bid, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Times a user's notifications are sent before they are given up on
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+
+# Seconds after which events a dispatcher claimed but never marked
+# dispatched, e.g. because it was stopped, can be claimed by another
+CLAIM_TIMEOUT = 300
+
+_stats = {"batches": 0, "events": 0, "digests": 0, "messages": 0,
+          "failures": 0, "busy_seconds": 0.0, "in_flight": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+
+def notification_stats():
+    # Counts of this process since it started, and the outbox backlog
+    with _stats_lock:
+        stats = dict(_stats)
+    busy = stats["busy_seconds"]
+    stats["messages_per_second"] = stats["messages"] / busy if busy else None
+    stats["backlog"] = OutboxEvent.objects.filter(
+        dispatched__isnull=True).count()
+    return stats
+
+
+class FileSink:
+    # Append each user's notifications to a JSON lines file
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, user, messages):
+        line = json.dumps({"user": user["username"], "messages": messages,
+                           "sent": timezone.now().isoformat()})
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class EmailSink:
+    # Send through Django's EMAIL_BACKEND, e.g. SMTP or the console
+    def __init__(self, from_email=None):
+        self.from_email = from_email
+
+    def send(self, user, messages):
+        if not user["email"]:
+            return
+        subject = messages[0] if len(messages) == 1 else \
+            f"{len(messages)} updates on your auctions"
+        send_mail(subject, "\n".join(messages), self.from_email,
+                  [user["email"]])
+
+
+class WebhookSink:
+    # POST each user's notifications as JSON
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, user, messages):
+        body = json.dumps({"user": user["username"], "messages": messages})
+        request = Request(self.url, data=body.encode(), method="POST",
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=self.timeout):
+            pass
+
+
+def get_sink():
+    # The sink configured by NOTIFICATION_SINK
+    config = settings.NOTIFICATION_SINK
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+class Dispatcher:
+    """
+    Fan outbox events out to the users they concern, one digest per user
+    per batch, sent by a thread pool. At most max_in_flight digests are
+    queued or being sent: past that the dispatcher waits before claiming
+    more events, which stay in the outbox meanwhile.
+    """
+
+    def __init__(self, sink=None, batch_size=500, workers=4,
+                 max_in_flight=100):
+        self.sink = sink or get_sink()
+        self.batch_size = batch_size
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="notifications")
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+
+    def claim(self, now):
+        """
+        Claim up to batch_size pending events in one UPDATE, so dispatchers
+        running side by side never send the same ones, and return the
+        claim's id.
+        """
+        claim = uuid.uuid4()
+        claimable = OutboxEvent.objects.filter(
+            Q(claimed_at__isnull=True) |
+            Q(claimed_at__lt=now - timedelta(seconds=CLAIM_TIMEOUT)),
+            dispatched__isnull=True)
+        # The conditions are repeated outside the subquery, for databases
+        # that check them again on rows another claim has just updated
+        claimable.filter(id__in=claimable.order_by("id").values("id")[
+            :self.batch_size]).update(claimed_by=claim, claimed_at=now)
+        return claim
+
+    def tick(self):
+        # Dispatch one batch of events, and return how many there were
+        start = time.perf_counter()
+        claim = self.claim(timezone.now())
+        try:
+            return self._dispatch(claim, start)
+        except Exception:
+            # Let the next tick, here or in another dispatcher, take the
+            # batch again rather than wait for CLAIM_TIMEOUT
+            OutboxEvent.objects.filter(
+                claimed_by=claim, dispatched__isnull=True).update(
+                claimed_by=None, claimed_at=None)
+            raise
+
+    def _dispatch(self, claim, start):
+        # The bidder an outbid event's bid beat, looked up in the same query
+        previous_bids = Bid.objects.filter(
+            item_id=OuterRef("listing_id"),
+            bid_ammount__lt=OuterRef("amount")).order_by("-bid_ammount")
+        events = list(OutboxEvent.objects.filter(
+            dispatched__isnull=True, claimed_by=claim).annotate(
+            previous_bidder=Case(
+                When(kind=OutboxEvent.OUTBID, then=Subquery(
+                    previous_bids.values("bidder")[:1])),
+                output_field=IntegerField())).order_by("id").values(
+            "id", "listing_id", "kind", "amount", "user_id",
+            "previous_bidder"))
+        if not events:
+            return 0
+
+        digests = self.fan_out(events)
+        users = {user["id"]: user for user in User.objects.filter(
+            id__in=digests).values("id", "username", "email")}
+        futures = []
+        for user_id, messages in digests.items():
+            if user_id in users:
+                self.slots.acquire()
+                _count(in_flight=1)
+                futures.append(self.pool.submit(
+                    self._send, users[user_id], messages))
+        wait(futures)
+
+        OutboxEvent.objects.filter(claimed_by=claim).update(
+            dispatched=timezone.now())
+        _count(batches=1, events=len(events),
+               busy_seconds=time.perf_counter() - start)
+        return len(events)
+
+    def fan_out(self, events):
+        """
+        Return the messages each user gets for the events: the watchers of
+        the listing, plus the outbid bidder, an outbid event's
+        previous_bidder, or the seller and the winner.
+        """
+        listing_ids = {event["listing_id"] for event in events}
+        listings = {listing["id"]: listing for listing in Listing.objects
+                    .filter(id__in=listing_ids).values("id", "title",
+                                                       "seller_id")}
+        watchers = defaultdict(set)
+        for listing_id, user_id in Watchlist.objects.filter(
+                listing_id__in=listing_ids).values_list("listing_id", "user"):
+            watchers[listing_id].add(user_id)
+
+        digests = defaultdict(list)
+        for event in events:
+            listing = listings.get(event["listing_id"])
+            if listing is None:
+                continue
+            title, amount = listing["title"], event["amount"]
+            recipients = dict.fromkeys(watchers[listing["id"]])
+
+            if event["kind"] == OutboxEvent.OUTBID:
+                for user_id in recipients:
+                    recipients[user_id] = f"New bid of ${amount} on {title}."
+                previous = event["previous_bidder"]
+                if previous is not None:
+                    recipients[previous] = \
+                        f"You were outbid on {title}: ${amount}."
+                recipients.pop(event["user_id"], None)
+            else:
+                recipients[listing["seller_id"]] = None
+                for user_id in recipients:
+                    recipients[user_id] = f"{title} closed at ${amount}."
+                if event["user_id"] is not None:
+                    recipients[event["user_id"]] = \
+                        f"You won {title} for ${amount}!"
+
+            for user_id, message in recipients.items():
+                digests[user_id].append(message)
+        return digests
+
+    def _send(self, user, messages):
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    self.sink.send(user, messages)
+                    _count(digests=1, messages=len(messages))
+                    return
+                except Exception as error:
+                    if attempt == MAX_ATTEMPTS - 1:
+                        _count(failures=1)
+                        logger.warning("Can't notify %s: %s",
+                                       user["username"], error)
+                    else:
+                        time.sleep(RETRY_DELAY * 2 ** attempt)
+        finally:
+            _count(in_flight=-1)
+            self.slots.release()
+
+    def safe_tick(self):
+        """
+        Tick, logging rather than raising errors such as a locked database,
+        so a worker outlives them. A failed batch is released for the next
+        tick, or, if even that fails, left claimed until CLAIM_TIMEOUT.
+        """
+        try:
+            return self.tick()
+        except Exception:
+            logger.exception("Can't dispatch notifications, retrying.")
+            return 0
+
+    def run(self, stop, interval=1.0):
+        # Dispatch until the stop event is set, waiting interval seconds
+        # whenever the outbox is empty or a tick failed
+        while not stop.is_set():
+            if not self.safe_tick():
+                stop.wait(interval)
+
+
+def start_dispatcher_thread(interval=1.0, **kwargs):
+    """
+    Run a Dispatcher in a daemon thread of this process. Set the returned
+    event to stop it.
+    """
+    stop = threading.Event()
+    dispatcher = Dispatcher(**kwargs)
+    thread = threading.Thread(
+        target=dispatcher.run, args=(stop, interval), daemon=True,
+        name="notification-dispatcher")
+    thread.start()
+    return stop
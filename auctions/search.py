@@ -0,0 +1,237 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection
+
+from .models import Listing
+from .util import PAGE_SIZE, get_active_listings
+
+# SQLite FTS5 table holding each listing's title and description by id
+FTS_TABLE = "auctions_listing_fts"
+
+# How much more a word in the title counts than one in the description
+TITLE_WEIGHT = 3.0
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+# Whether each database, by name, has the FTS5 table
+_fts_tables = {}
+
+
+def fts_available():
+    """
+    Whether the FTS5 table exists. It is only created by the migration on
+    SQLite with FTS5, so it is looked up once per database rather than on
+    every search and listing save.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    name = connection.settings_dict["NAME"]
+    available = _fts_tables.get(name)
+    if available is None:
+        available = _fts_tables[name] = \
+            FTS_TABLE in connection.introspection.table_names()
+    return available
+
+
+class InvertedIndex:
+    """
+    Pure-Python term -> {listing id: weighted term frequency} index, used
+    when the database has no full-text search. Results are ranked by BM25.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.terms = {}
+        self.lengths = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            for listing_id, title, description in Listing.objects.values_list(
+                    "id", "title", "description").iterator(chunk_size=2000):
+                self._add(listing_id, title, description)
+            self.loaded = True
+
+    def add(self, listing_id, title, description):
+        with self.lock:
+            if self.loaded:
+                self._remove(listing_id)
+                self._add(listing_id, title, description)
+
+    def remove(self, listing_id):
+        with self.lock:
+            if self.loaded:
+                self._remove(listing_id)
+
+    def _add(self, listing_id, title, description):
+        counts = Counter()
+        for term in tokenize(title):
+            counts[term] += TITLE_WEIGHT
+        for term in tokenize(description):
+            counts[term] += 1
+        for term, count in counts.items():
+            self.postings[term][listing_id] = count
+        self.terms[listing_id] = list(counts)
+        self.lengths[listing_id] = sum(counts.values())
+
+    def _remove(self, listing_id):
+        for term in self.terms.pop(listing_id, ()):
+            postings = self.postings[term]
+            del postings[listing_id]
+            if not postings:
+                del self.postings[term]
+        self.lengths.pop(listing_id, None)
+
+    def search(self, terms):
+        # Ids of the listings containing every term, best match first
+        self.load()
+        with self.lock:
+            postings = [self.postings.get(term, {}) for term in set(terms)]
+            if not postings or not all(postings):
+                return []
+            postings.sort(key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+
+            documents = len(self.lengths)
+            average = sum(self.lengths.values()) / documents
+            scores = dict.fromkeys(matches, 0.0)
+            for term_postings in postings:
+                idf = math.log(1 + (documents - len(term_postings) + 0.5) /
+                               (len(term_postings) + 0.5))
+                for listing_id in matches:
+                    tf = term_postings[listing_id]
+                    norm = 1 - self.B + self.B * (
+                        self.lengths[listing_id] / average)
+                    scores[listing_id] += idf * tf * (self.K1 + 1) / (
+                        tf + self.K1 * norm)
+        return sorted(matches, key=lambda i: (-scores[i], i))
+
+
+fallback_index = InvertedIndex()
+
+
+def search(query, category=None, min_price=None, max_price=None,
+           limit=PAGE_SIZE):
+    """
+    Return up to limit active listings matching every word of the query,
+    best match first, optionally in a category and a current bid range.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    if fts_available():
+        ids = _search_fts(terms, category, min_price, max_price, limit)
+        found = {listing["id"]: listing for listing in
+                 get_active_listings(Listing.objects.filter(id__in=ids))}
+        return [found[i] for i in ids if i in found]
+
+    listings = Listing.objects.active()
+    if category:
+        listings = listings.filter(category__name=category)
+    if min_price is not None:
+        listings = listings.filter(current_bid__gte=min_price)
+    if max_price is not None:
+        listings = listings.filter(current_bid__lte=max_price)
+
+    # Filter ranked matches in chunks until the page is full
+    results = []
+    ranked = fallback_index.search(terms)
+    for start in range(0, len(ranked), 500):
+        chunk = ranked[start:start + 500]
+        found = {listing["id"]: listing for listing in
+                 get_active_listings(listings.filter(id__in=chunk))}
+        results.extend(found[i] for i in chunk if i in found)
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+def _search_fts(terms, category, min_price, max_price, limit):
+    # Quoted terms are matched literally and all of them are required
+    params = [" ".join('"{}"'.format(term) for term in terms)]
+    filters = ""
+    if category:
+        filters += (" AND l.category_id = (SELECT id FROM auctions_category "
+                    "WHERE name = %s)")
+        params.append(category)
+    if min_price is not None:
+        filters += " AND l.current_bid >= %s"
+        params.append(min_price)
+    if max_price is not None:
+        filters += " AND l.current_bid <= %s"
+        params.append(max_price)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT l.id FROM {FTS_TABLE} "
+            f"JOIN auctions_listing l ON l.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND l.active{filters} "
+            f"ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0) LIMIT %s",
+            [*params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def index_listing(listing):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                           [listing.id])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+                f"VALUES (%s, %s, %s)",
+                [listing.id, listing.title, listing.description])
+    else:
+        fallback_index.add(listing.id, listing.title, listing.description)
+
+
+def index_listings(rows):
+    # Add (id, title, description) rows written without signals
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+                f"VALUES (%s, %s, %s)", rows)
+    else:
+        for listing_id, title, description in rows:
+            fallback_index.add(listing_id, title, description)
+
+
+def unindex_listing(listing_id):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                           [listing_id])
+    else:
+        fallback_index.remove(listing_id)
+
+
+def rebuild_index():
+    # Reindex every listing, e.g. after rows were written with bulk_create
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+                f"SELECT id, title, description FROM auctions_listing")
+    else:
+        with fallback_index.lock:
+            fallback_index.loaded = False
+            fallback_index.postings.clear()
+            fallback_index.terms.clear()
+            fallback_index.lengths.clear()
+        fallback_index.load()
@@ -0,0 +1,249 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (pre_save, post_save, pre_delete,
+                                      post_delete)
+from django.dispatch import receiver
+
+from .auth import forget_user
+from .cache import bump_versions, forget_watchlist
+from .events import broker
+from .models import (User, Category, Listing, Watchlist, Comment, Bid,
+                     OutboxEvent, ListingArchive, ArchivedBid,
+                     ArchivedComment)
+from .leaderboards import leaderboards
+from .search import index_listing, unindex_listing
+from .stats import (listing_deleted, listing_stats_changed,
+                    refresh_category_stats)
+
+
+def after_commit(function, *args):
+    """
+    Call function(*args) once the current transaction commits, or now
+    outside one. Cached copies are dropped that way: dropped any earlier, a
+    request still reading the rows as they were could cache them again,
+    under the new version, until CACHE_TIMEOUT.
+    """
+    transaction.on_commit(lambda: function(*args))
+
+
+def listing_changed(listing_id, category_name):
+    # A listing's card, page, and the grids showing it are now stale
+    after_commit(bump_versions, f"listing:{listing_id}", "listings",
+                 f"category:{category_name}")
+
+
+def _stats_row(listing_id, lock=False):
+    # What a listing's category summary depends on, as stored
+    listings = Listing.objects.filter(id=listing_id)
+    if lock:
+        listings = listings.select_for_update()
+    return listings.values("active", "category_id", "current_bid").first()
+
+
+@receiver([pre_save, pre_delete], sender=Listing)
+def remember_listing(sender, instance, **kwargs):
+    # The row as it was, locked until the change commits, for the post_save
+    # and post_delete handlers to tell what changed
+    instance._stored = None if instance._state.adding else \
+        _stats_row(instance.id, lock=True)
+
+
+@receiver(post_save, sender=Listing)
+def on_listing_stats(sender, instance, **kwargs):
+    # Read back rather than taken from the instance, which update_fields
+    # may have saved only part of
+    listing_stats_changed(instance.id, getattr(instance, "_stored", None),
+                          _stats_row(instance.id))
+
+
+@receiver(post_delete, sender=Listing)
+def on_listing_delete_stats(sender, instance, **kwargs):
+    stored = getattr(instance, "_stored", None)
+    if stored and stored["active"]:
+        listing_deleted(stored["category_id"])
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def on_listing_change(sender, instance, **kwargs):
+    category = Category.objects.filter(
+        id=instance.category_id).values_list("name", flat=True).first()
+    listing_changed(instance.id, category)
+
+
+@receiver(post_save, sender=Listing)
+def on_listing_save(sender, instance, **kwargs):
+    index_listing(instance)
+
+
+@receiver(pre_delete, sender=Listing)
+def delete_archived_rows(sender, instance, **kwargs):
+    # Archived rows have no foreign key to be deleted along. Only archived
+    # listings have any, so the archive is left alone for the others: its
+    # tables may not even exist until something is archived.
+    if ListingArchive.objects.filter(listing_id=instance.id).exists():
+        ArchivedBid.objects.filter(item_id=instance.id).delete()
+        ArchivedComment.objects.filter(listing_id=instance.id).delete()
+
+
+@receiver(post_delete, sender=Listing)
+def on_listing_delete(sender, instance, **kwargs):
+    unindex_listing(instance.id)
+    transaction.on_commit(lambda: leaderboards.listing_removed(instance.id))
+
+
+@receiver(post_save, sender=Listing)
+def rank_listing(sender, instance, **kwargs):
+    transaction.on_commit(lambda: leaderboards.listing_saved(instance))
+
+
+def _closed_by_save(instance, created):
+    # Saved inactive when it was stored active, rather than any later save
+    # of a closed listing
+    stored = getattr(instance, "_stored", None)
+    return not created and not instance.active and \
+        bool(stored and stored["active"])
+
+
+@receiver(post_save, sender=Listing)
+def publish_close(sender, instance, created, **kwargs):
+    if _closed_by_save(instance, created):
+        data = {"current_bid": instance.current_bid,
+                "bid_count": instance.bid_count}
+        transaction.on_commit(
+            lambda: broker.publish(instance.id, "close", data))
+
+
+def listings_closed(listings):
+    """
+    Do what Listing signals do for auctions closed by a bulk UPDATE. Each
+    listing is a dict of its id, category_id, category__name, current_bid,
+    bid_count and highest_bidder.
+
+    Call it in the transaction of the UPDATE: the outbox events and
+    category summaries are written along with it, and everything outside
+    the database is told once it commits.
+    """
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(listing_id=listing["id"], kind=OutboxEvent.CLOSED,
+                    amount=listing["current_bid"],
+                    user_id=listing["highest_bidder"])
+        for listing in listings)
+    refresh_category_stats(listing["category_id"] for listing in listings)
+
+    def closed():
+        for listing in listings:
+            listing_changed(listing["id"], listing["category__name"])
+            leaderboards.listing_removed(listing["id"])
+            broker.publish(listing["id"], "close", {
+                "current_bid": listing["current_bid"],
+                "bid_count": listing["bid_count"]})
+    transaction.on_commit(closed)
+
+
+@receiver([post_save, post_delete], sender=Bid)
+def on_bid_change(sender, instance, **kwargs):
+    # Looked up rather than read from instance.item, which is already gone
+    # when the bid is deleted along with its listing. The category summary
+    # is updated by bidding.place_bid, in the bid's transaction.
+    category = Listing.objects.filter(id=instance.item_id).values_list(
+        "category__name", flat=True).first()
+    listing_changed(instance.item_id, category)
+
+
+@receiver(post_save, sender=Bid)
+def publish_bid(sender, instance, created, **kwargs):
+    if created:
+        data = {"bid_ammount": instance.bid_ammount,
+                "bidder": instance.bidder.username}
+        transaction.on_commit(
+            lambda: broker.publish(instance.item_id, "bid", data))
+
+
+@receiver(post_save, sender=Listing)
+def queue_close(sender, instance, created, **kwargs):
+    # Watchers are told by auctions.notifications, off the request path
+    if _closed_by_save(instance, created):
+        OutboxEvent.objects.create(
+            listing_id=instance.id, kind=OutboxEvent.CLOSED,
+            amount=instance.current_bid, user_id=instance.winner_id)
+
+
+@receiver(post_save, sender=Bid)
+def queue_outbid(sender, instance, created, **kwargs):
+    # One row in the bid's transaction, whatever the number of watchers
+    if created:
+        OutboxEvent.objects.create(
+            listing_id=instance.item_id, kind=OutboxEvent.OUTBID,
+            amount=instance.bid_ammount, user_id=instance.bidder_id)
+
+
+@receiver(post_save, sender=Bid)
+def rank_bid(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: leaderboards.bid_placed(
+            instance.item_id, instance.bid_ammount))
+
+
+def bump_listing_version(listing_id):
+    # For writes that don't UPDATE the listing row anyway
+    Listing.objects.filter(id=listing_id).update(version=F("version") + 1)
+
+
+@receiver(post_delete, sender=Bid)
+def on_bid_delete(sender, instance, **kwargs):
+    # A new bid is counted by the UPDATE in bidding.place_bid
+    bump_listing_version(instance.item_id)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def on_comment_change(sender, instance, **kwargs):
+    bump_listing_version(instance.listing_id)
+    after_commit(bump_versions, f"listing:{instance.listing_id}")
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment(sender, instance, created, **kwargs):
+    if created:
+        data = {"user": instance.user.username, "comment": instance.comment}
+        transaction.on_commit(
+            lambda: broker.publish(instance.listing_id, "comment", data))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def on_category_change(sender, instance, **kwargs):
+    after_commit(bump_versions, "categories", f"category:{instance.name}")
+
+
+@receiver([post_save, post_delete], sender=Watchlist)
+def on_watchlist_change(sender, instance, **kwargs):
+    after_commit(forget_watchlist, instance.user_id)
+    # The index page ranks listings by watchers
+    after_commit(bump_versions, "listings")
+
+
+@receiver(post_save, sender=Watchlist)
+def on_watchlist_add(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: leaderboards.watchers_changed(instance.listing_id, 1))
+
+
+@receiver(post_delete, sender=Watchlist)
+def on_watchlist_remove(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: leaderboards.watchers_changed(instance.listing_id, -1))
+
+
+@receiver([post_save, post_delete], sender=User)
+def on_user_change(sender, instance, **kwargs):
+    # Password, profile or permission changes apply from the next request
+    after_commit(forget_user, instance.id)
+
+
+@receiver(post_delete, sender=User)
+def on_user_delete(sender, instance, **kwargs):
+    # Like the bids and comments deleted along with the user, if anything
+    # was archived at all
+    if ListingArchive.objects.exists():
+        ArchivedBid.objects.filter(bidder_id=instance.id).delete()
+        ArchivedComment.objects.filter(user_id=instance.id).delete()
@@ -0,0 +1,70 @@
+// Follow bids, comments and the auction closing without reloading the
+// page, and load older comments in place
+document.addEventListener("DOMContentLoaded", () => {
+  const listing = document.querySelector("#listing");
+
+  const element = (tag, text, className) => {
+    const node = document.createElement(tag);
+    node.textContent = text;
+    if (className) {
+      node.className = className;
+    }
+    return node;
+  };
+
+  const appendComment = (comment) => {
+    let comments = document.querySelector(".comments");
+    if (!comments) {
+      comments = element("div", "", "comments");
+      document.querySelector(".no-comments").replaceWith(comments);
+    }
+    const wrapper = element("div", "", "comment-wrapper");
+    const username = element("p", "", "username");
+    username.append(element("b", comment.user));
+    wrapper.append(username, element("p", comment.comment, "comment"));
+    comments.append(wrapper);
+  };
+
+  const loadMore = document.querySelector(".load-more");
+  if (loadMore) {
+    loadMore.addEventListener("click", async (event) => {
+      event.preventDefault();
+      const response = await fetch(
+        `${loadMore.dataset.url}?after=${loadMore.dataset.cursor}`
+      );
+      const page = await response.json();
+      page.comments.forEach(appendComment);
+      if (page.next_cursor) {
+        loadMore.dataset.cursor = page.next_cursor;
+      } else {
+        loadMore.remove();
+      }
+    });
+  }
+
+  if (!listing.dataset.events) {
+    return;
+  }
+  const events = new EventSource(listing.dataset.events);
+
+  events.addEventListener("bid", (event) => {
+    const bid = JSON.parse(event.data);
+    const currentBid = document.querySelector("#current-bid");
+    currentBid.replaceChildren(
+      element("h3", `Winning bid: $${bid.bid_ammount}`),
+      element("h4", `Bidder: ${bid.bidder}`)
+    );
+  });
+
+  events.addEventListener("comment", (event) => {
+    // Newer comments show up when the last page is reached
+    if (!document.querySelector(".load-more")) {
+      appendComment(JSON.parse(event.data));
+    }
+  });
+
+  events.addEventListener("close", () => {
+    events.close();
+    window.location.reload();
+  });
+});
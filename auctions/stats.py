@@ -0,0 +1,236 @@
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .cache import bump_versions
+from .models import Category, CategoryStats, Listing
+
+# Number of price ranges offered on a category page
+PRICE_FACETS = 4
+
+
+def _median(listings, count):
+    # Lower median as a (current_bid, id) key, ties broken by id, read off
+    # the (category, current_bid) index
+    if not count:
+        return None, None
+    return listings.order_by("current_bid", "id").values_list(
+        "current_bid", "id")[(count - 1) // 2]
+
+
+def category_summary(category_id):
+    # The summary of a category, as CategoryStats fields, from scratch
+    listings = Listing.objects.active().filter(category_id=category_id)
+    summary = listings.aggregate(
+        active_count=Count("id"), min_bid=Min("current_bid"),
+        max_bid=Max("current_bid"))
+    summary["median_bid"], summary["median_id"] = _median(
+        listings, summary["active_count"])
+    return summary
+
+
+def _categories_changed():
+    # The categories page shows every summary. Bumped once the change is
+    # committed, so it can't be cached again from the rows as they were.
+    transaction.on_commit(lambda: bump_versions("categories"))
+
+
+def _seek(listings, key, after):
+    # The (current_bid, id) key next to key in the category's index, after
+    # or before it, in two seeks rather than an OR no index can serve
+    bid, listing_id = key
+    if after:
+        ties = listings.filter(current_bid=bid, id__gt=listing_id)
+        rest = listings.filter(current_bid__gt=bid)
+        order = ("current_bid", "id")
+    else:
+        ties = listings.filter(current_bid=bid, id__lt=listing_id)
+        rest = listings.filter(current_bid__lt=bid)
+        order = ("-current_bid", "-id")
+    return (ties.order_by(*order).values_list("current_bid", "id").first() or
+            rest.order_by(*order).values_list("current_bid", "id").first())
+
+
+def refresh_category_stats(category_ids):
+    """
+    Recompute the summary of the given categories from their listings,
+    e.g. after a bulk import or UPDATE. Each one costs a few queries over
+    the category's slice of an index, whatever the number of listings
+    elsewhere.
+    """
+    now = timezone.now()
+    for category_id in set(category_ids) - {None}:
+        CategoryStats.objects.update_or_create(
+            category_id=category_id,
+            defaults=dict(category_summary(category_id), last_activity=now))
+    _categories_changed()
+
+
+def update_category_stats(category_id, listing_id, old_bid=None,
+                          new_bid=None):
+    """
+    Update the summary of a category after one of its active listings
+    changed bid from old_bid to new_bid, old_bid being None for a listing
+    that joined the category's active listings and new_bid None for one
+    that left them.
+
+    Call it in the transaction making the change, once the listing row is
+    written: the count moves by one, the median by at most one listing
+    from the one recorded, and the minimum and maximum are only looked up
+    again when the listing held them, each a seek or two in the index.
+    """
+    if category_id is None or old_bid == new_bid:
+        return
+    # Locked, where the database can, against concurrent updates of the
+    # same summary until the change commits
+    stats = CategoryStats.objects.select_for_update().filter(
+        category_id=category_id).first()
+    if stats is None or (stats.active_count and stats.median_id is None):
+        # Nothing to start from, e.g. a new category's first listing
+        refresh_category_stats([category_id])
+        return
+
+    listings = Listing.objects.active().filter(category_id=category_id)
+    old = None if old_bid is None else (old_bid, listing_id)
+    new = None if new_bid is None else (new_bid, listing_id)
+    count = stats.active_count + (new is not None) - (old is not None)
+
+    if not count:
+        stats.min_bid = stats.max_bid = None
+        median = (None, None)
+    elif stats.median_id is None:
+        # The category's first active listing
+        stats.min_bid = stats.max_bid = new_bid
+        median = new
+    else:
+        median = (stats.median_bid, stats.median_id)
+        # Listings below the recorded median now, against below the median
+        # there should be
+        below = ((stats.active_count - 1) // 2 -
+                 (old is not None and old < median) +
+                 (new is not None and new < median))
+        offset = below - (count - 1) // 2
+        if median == old:
+            # The median listing itself moved or left
+            median = _seek(listings, median, after=offset == 0)
+        elif offset:
+            median = _seek(listings, median, after=offset < 0)
+
+        if new is not None and new_bid < stats.min_bid:
+            stats.min_bid = new_bid
+        elif old is not None and old_bid == stats.min_bid:
+            stats.min_bid = listings.order_by("current_bid").values_list(
+                "current_bid", flat=True).first()
+        if new is not None and new_bid > stats.max_bid:
+            stats.max_bid = new_bid
+        elif old is not None and old_bid == stats.max_bid:
+            stats.max_bid = listings.order_by("-current_bid").values_list(
+                "current_bid", flat=True).first()
+
+    stats.active_count = count
+    stats.median_bid, stats.median_id = median
+    stats.last_activity = timezone.now()
+    stats.save()
+    _categories_changed()
+
+
+def listing_stats_changed(listing_id, before, after):
+    """
+    Update the summaries a listing counts in after it was saved. before
+    and after are dicts of its active, category_id and current_bid, before
+    being None for a new listing.
+    """
+    old = before if before and before["active"] else None
+    new = after if after["active"] else None
+    if old and new and old["category_id"] == new["category_id"]:
+        update_category_stats(old["category_id"], listing_id,
+                              old["current_bid"], new["current_bid"])
+        return
+    if old:
+        update_category_stats(old["category_id"], listing_id,
+                              old_bid=old["current_bid"])
+    if new:
+        update_category_stats(new["category_id"], listing_id,
+                              new_bid=new["current_bid"])
+
+
+class _DeletedCategories:
+    """
+    The categories that lost active listings to deletes in the current
+    transaction of a connection, each refreshed once when it commits.
+    """
+
+    def __init__(self, connection, category_id):
+        self.connection = connection
+        self.category_ids = {category_id}
+        connection._deleted_categories = self
+        # Where the hook is in the connection's list, to tell if a rollback
+        # dropped it
+        self.index = len(connection.run_on_commit)
+        transaction.on_commit(self.refresh, using=connection.alias)
+
+    def pending(self):
+        hooks = self.connection.run_on_commit
+        return self.index < len(hooks) and hooks[self.index][1] == self.refresh
+
+    def refresh(self):
+        self.connection._deleted_categories = None
+        # Not those deleted along with their listings, summary and all
+        refresh_category_stats(CategoryStats.objects.filter(
+            category_id__in=self.category_ids).values_list(
+            "category_id", flat=True))
+
+
+def listing_deleted(category_id):
+    """
+    Recompute the summary of a category after one of its active listings
+    was deleted, once the transaction commits. It can't be moved listing by
+    listing: a bulk delete removes every row before sending the first
+    post_delete signal. So it is done once per category and transaction,
+    however many listings went. A category being deleted has had its
+    summary deleted already, and none is made again.
+    """
+    connection = transaction.get_connection()
+    deleted = getattr(connection, "_deleted_categories", None)
+    if deleted is not None and deleted.pending():
+        deleted.category_ids.add(category_id)
+    else:
+        _DeletedCategories(connection, category_id)
+
+
+def rebuild_category_stats():
+    """
+    Recompute the summary of every category from scratch, keeping the last
+    activity times already recorded.
+    """
+    summaries = {row.pop("category"): row for row in Listing.objects.active()
+                 .order_by().values("category").annotate(
+                     active_count=Count("id"), min_bid=Min("current_bid"),
+                     max_bid=Max("current_bid"))}
+    last_activity = dict(CategoryStats.objects.values_list(
+        "category_id", "last_activity"))
+
+    stats = []
+    for category_id in Category.objects.values_list("id", flat=True):
+        summary = summaries.get(category_id, {"active_count": 0})
+        summary["median_bid"], summary["median_id"] = _median(
+            Listing.objects.active().filter(category_id=category_id),
+            summary["active_count"])
+        stats.append(CategoryStats(
+            category_id=category_id,
+            last_activity=last_activity.get(category_id), **summary))
+
+    with transaction.atomic():
+        CategoryStats.objects.all().delete()
+        CategoryStats.objects.bulk_create(stats)
+    bump_versions("categories")
+    return len(stats)
+
+
+def price_facets(stats, facets=PRICE_FACETS):
+    # Up to facets (min, max) ranges splitting the category's current bids
+    if stats is None or not stats.active_count:
+        return []
+    step = max(1, -(-(stats.max_bid - stats.min_bid + 1) // facets))
+    return [(low, min(low + step - 1, stats.max_bid))
+            for low in range(stats.min_bid, stats.max_bid + 1, step)]
@@ -0,0 +1,125 @@
+import gzip
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth compressing; images and fonts are compressed already
+COMPRESSED_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html",
+                         ".map", ".xml")
+
+# Only the app's own files are minified. Third-party ones, such as the
+# admin's, ship minified where it matters.
+MINIFIED_PREFIX = "auctions/"
+
+_CSS_TOKENS = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'
+    r"|(?P<comment>/\*.*?\*/)"
+    r"|(?P<other>[^\"'/]+|/)", re.S)
+
+
+def minify_css(css):
+    """
+    Drop comments and the whitespace around punctuation, leaving strings
+    alone. Spaces before a colon are kept, as in a selector like "a :hover"
+    they matter.
+    """
+    output = []
+    for match in _CSS_TOKENS.finditer(css):
+        if match.group("comment"):
+            continue
+        text = match.group("string")
+        if text is None:
+            text = re.sub(r"\s+", " ", match.group("other"))
+            text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+            text = re.sub(r":\s+", ":", text)
+            # A block's last semicolon goes, even if a comment follows it
+            text = text.replace(";}", "}")
+            if text.startswith("}") and output and output[-1].endswith(";"):
+                output[-1] = output[-1][:-1]
+        output.append(text)
+    return "".join(output).strip()
+
+
+def minify_js(js):
+    """
+    Drop indentation, blank lines and whole-line // comments. Line breaks
+    are kept, so automatic semicolon insertion works the same, and lines
+    inside a multi-line template literal, found by counting backticks, are
+    left as they are.
+    """
+    output = []
+    in_template = False
+    for line in js.splitlines():
+        if not in_template:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+        output.append(line)
+        if line.count("`") % 2:
+            in_template = not in_template
+    return "\n".join(output) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Collect static files under names with a hash of their content, minify
+    the app's CSS and JavaScript, and write gzip and, if the brotli module
+    is installed, brotli variants next to every text file, for
+    StaticAssetMiddleware to serve.
+    """
+
+    def stored_name(self, name):
+        # Until collectstatic has been run, e.g. running locally with DEBUG
+        # off, use the plain names rather than failing every page
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in self.hashed_files.items():
+            self._process(hashed_name, minify=True)
+            if name != hashed_name:
+                self._process(name)
+
+    def _process(self, name, minify=False):
+        # The copy under the plain name isn't minified: collectstatic hashes
+        # it again on the next run, and its hash must stay that of the source
+        extension = os.path.splitext(name)[1]
+        if extension not in COMPRESSED_EXTENSIONS:
+            return
+        path = self.path(name)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        minifier = MINIFIERS.get(extension)
+        if minify and minifier and name.startswith(MINIFIED_PREFIX) and \
+                ".min." not in name:
+            data = minifier(data.decode()).encode()
+            with open(path, "wb") as f:
+                f.write(data)
+
+        # A fixed mtime keeps the output the same from run to run
+        self._write_variant(path + ".gz", data,
+                            gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            self._write_variant(path + ".br", data, brotli.compress(data))
+
+    def _write_variant(self, path, data, compressed):
+        # A variant that doesn't save anything is left out
+        if len(compressed) < len(data):
+            with open(path, "wb") as f:
+                f.write(compressed)
+        elif os.path.exists(path):
+            os.remove(path)
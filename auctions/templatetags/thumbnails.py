@@ -0,0 +1,11 @@
+from django import template
+
+from auctions.thumbnails import thumbnail_url
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(image_url, size):
+    # {{ listing.image_url|thumbnail:200 }}
+    return thumbnail_url(image_url, size)
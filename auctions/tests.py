@@ -1,3 +1,610 @@
-from django.test import TestCase
+import io
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import ExitStack
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .archive import archive_batch
+from .bidding import BidError, place_bid
+from .cache import cache_stats
+from .cards import render_card_fast, render_card_template
+from .db import archive_database
+from .leaderboards import Leaderboards
+from .models import (User, Category, CategoryStats, Listing, Watchlist,
+                     Comment, Bid, ListingArchive, ArchivedBid,
+                     ArchivedComment)
+from .stats import category_summary, refresh_category_stats
+from .storage import minify_css, minify_js
+from .thumbnails import (SIZES, Image, ThumbnailCache, ThumbnailError,
+                         thumbnail_url)
+from .views import ListingForm
+
+# A table scan that no index helps with, e.g. "SCAN auctions_listing"
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?\w+$")
+
+
+@unittest.skipUnless(connection.vendor == "sqlite",
+                     "EXPLAIN QUERY PLAN is specific to SQLite.")
+class QueryPlanTests(TestCase):
+    """
+    Render every auctions page and run EXPLAIN QUERY PLAN on its filtered
+    queries, failing on any full table scan.
+    """
+
+    # Inside the test's transaction ReplicaRouter reads from the default
+    # alias, and the replica, a mirror of it, can't be wrapped in one too
+    databases = {"default", archive_database()}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("plans")
+        cls.category = Category.objects.create(name="Plans")
+        cls.listing = Listing.objects.create(
+            seller=cls.user, category=cls.category, title="Plans",
+            description="Query plans", starting_bid=1, active=True)
+        Bid.objects.create(item=cls.listing, bidder=cls.user, bid_ammount=2)
+        Comment.objects.create(listing=cls.listing, user=cls.user,
+                               comment="Plans")
+        Watchlist.objects.create(listing=cls.listing, user=cls.user)
+        # No ANALYZE: without statistics SQLite plans as if every table were
+        # large, which is the case these indexes are for.
+
+    def captured(self, url):
+        # Queries of a page on every alias the test may use. A query on any
+        # other, such as the replica, fails the test by itself.
+        self.client.force_login(self.user)
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in self.databases
+            ]
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for queries in captured for query in queries]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_no_full_table_scans(self):
+        pages = [
+            reverse("index"),
+            reverse("index") + f"?cursor=a{self.listing.id}",
+            reverse("listing", args=[self.listing.id]),
+            reverse("watchlist"),
+            reverse("categories"),
+            reverse("category", args=[self.category.name]),
+            reverse("search") + "?q=plans",
+        ]
+        for url in pages:
+            with self.subTest(url=url):
+                queries = self.captured(url)
+                self.assertTrue(queries, "No queries were captured.")
+                for sql in queries:
+                    # Unfiltered queries read the whole table on purpose
+                    if " WHERE " not in sql or not sql.startswith("SELECT"):
+                        continue
+                    scans = [detail for detail in self.explain(sql)
+                             if FULL_SCAN.match(detail)]
+                    self.assertFalse(scans, f"Full table scan in {sql}")
+
+
+class PlaceBidTests(TransactionTestCase):
+    # Commit hooks only run outside TestCase's wrapping transaction
+
+    databases = {"default", archive_database()}
+
+    def test_failed_commit_hook_does_not_place_bid_again(self):
+        user = User.objects.create_user("hooks")
+        listing = Listing.objects.create(
+            seller=user, category=Category.objects.create(name="Hooks"),
+            title="Hooks", description="Hooks", starting_bid=1, active=True)
+        with mock.patch("auctions.leaderboards.leaderboards.bid_placed",
+                        side_effect=OperationalError("database is locked")), \
+                self.assertLogs("auctions.bidding", "ERROR"):
+            bid = place_bid(listing, user, 5)
+        self.assertEqual(list(Bid.objects.values_list("id", flat=True)),
+                         [bid.id])
+        listing.refresh_from_db()
+        self.assertEqual((listing.current_bid, listing.bid_count), (5, 1))
+
+
+class CategoryStatsTests(TestCase):
+    """
+    Apply random bids, listing edits, closes and deletes, checking after
+    each that the summaries kept change by change match ones computed from
+    scratch.
+    """
+
+    databases = {"default", archive_database()}
+
+    def assertSummaries(self, categories):
+        for category in categories:
+            expected = category_summary(category.id)
+            stats = CategoryStats.objects.filter(category=category).values(
+                *expected).first()
+            # Missing until the category's first listing
+            if stats is not None or expected["active_count"]:
+                self.assertEqual(stats, expected)
+
+    def test_random_changes(self):
+        rng = random.Random(17)
+        user = User.objects.create_user("stats")
+        categories = [Category.objects.create(name=f"Stats {i}")
+                      for i in range(3)]
+        listings = []
+        for step in range(300):
+            action = rng.random()
+            if action < 0.2 or not listings:
+                listings.append(Listing.objects.create(
+                    seller=user, category=rng.choice(categories),
+                    title="Stats", description="Stats",
+                    starting_bid=rng.randint(1, 20), active=True))
+            elif action < 0.75:
+                listing = rng.choice(listings)
+                try:
+                    place_bid(listing, user,
+                              listing.current_bid + rng.randint(0, 5))
+                except BidError:
+                    pass
+            elif action < 0.85:
+                listing = rng.choice(listings)
+                listing.category = rng.choice(categories)
+                listing.active = rng.random() < 0.7
+                listing.save()
+            elif action < 0.95:
+                listing = rng.choice(listings)
+                listing.starting_bid = listing.current_bid = \
+                    rng.randint(1, 20)
+                listing.save()
+            else:
+                # Summaries are refreshed once the delete commits
+                with self.captureOnCommitCallbacks(execute=True):
+                    listings.pop(rng.randrange(len(listings))).delete()
+            with self.subTest(step=step):
+                self.assertSummaries(categories)
+
+        # Deleted in one batch, each category refreshed once, then with
+        # their category
+        deleted = Listing.objects.filter(id__in=[
+            listing.id for listing in listings if listing.id % 2])
+        affected = set(deleted.active().values_list("category", flat=True))
+        with mock.patch("auctions.stats.refresh_category_stats",
+                        wraps=refresh_category_stats) as refresh, \
+                self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(set(refresh.call_args[0][0]), affected)
+        self.assertSummaries(categories)
+        with self.captureOnCommitCallbacks(execute=True):
+            categories.pop().delete()
+        self.assertSummaries(categories)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """
+    Serve a PNG of a color given by the path, e.g. /7.png, counting the
+    requests for each path. /missing.png is a 404, and paths under /slow/
+    only answer once the server's release event is set.
+    """
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] = \
+                self.server.hits.get(self.path, 0) + 1
+        if self.path == "/missing.png":
+            self.send_error(404)
+            return
+        if self.path.startswith("/slow/"):
+            self.server.release.wait(10)
+        shade = int(re.sub(r"\D", "", self.path) or 0) * 37 % 256
+        data = io.BytesIO()
+        Image.new("RGB", (640, 480), (shade, 255 - shade, 0)).save(
+            data, "PNG")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data.getvalue())))
+        self.end_headers()
+        self.wfile.write(data.getvalue())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed.")
+class ThumbnailCacheTests(SimpleTestCase):
+    # Against an image host on localhost, which only caches allowing
+    # private hosts may fetch from
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.hits = {}
+        self.server.release = threading.Event()
+        self.addCleanup(self.server.release.set)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = self.make_cache()
+
+    def make_cache(self, max_bytes=10 * 1024 * 1024,
+                   allow_private_hosts=True):
+        cache = ThumbnailCache(self.directory, max_bytes,
+                               allow_private_hosts=allow_private_hosts)
+        self.addCleanup(cache.pool.shutdown)
+        return cache
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def test_concurrent_requests_fetch_once(self):
+        url = self.url("/slow/1.png")
+        paths = []
+        threads = [threading.Thread(
+            target=lambda: paths.append(self.cache.get(url, SIZES[0])))
+            for _ in range(8)]
+        # The fetch is held open until every request has asked for it
+        with mock.patch.object(self.cache, "submit",
+                               wraps=self.cache.submit) as submit:
+            for thread in threads:
+                thread.start()
+            while submit.call_count < len(threads):
+                time.sleep(0.01)
+        self.server.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(paths), 8)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.server.hits, {"/slow/1.png": 1})
+        with Image.open(paths[0]) as image:
+            self.assertEqual(image.size, (SIZES[0], SIZES[0] * 3 // 4))
+        # Every size was made along with the first
+        self.cache.get(url, SIZES[1])
+        self.assertEqual(self.server.hits, {"/slow/1.png": 1})
+
+    def test_missing_image(self):
+        with self.assertLogs("auctions.thumbnails", "WARNING"):
+            with self.assertRaises(ThumbnailError):
+                self.cache.get(self.url("/missing.png"), SIZES[0])
+        # Not fetched again until RETRY_AFTER has passed
+        with self.assertRaisesMessage(ThumbnailError, "failed recently"):
+            self.cache.get(self.url("/missing.png"), SIZES[0])
+        self.assertEqual(self.server.hits, {"/missing.png": 1})
+
+    def test_slow_host(self):
+        url = self.url("/slow/2.png")
+        with self.assertRaisesMessage(ThumbnailError, "Timed out"):
+            self.cache.get(url, SIZES[0], timeout=0.2)
+        # Made once the host answers, for the requests that come later
+        self.server.release.set()
+        path = self.cache.get(url, SIZES[0])
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.server.hits, {"/slow/2.png": 1})
+
+    def test_private_host_refused(self):
+        cache = self.make_cache(allow_private_hosts=False)
+        with self.assertLogs("auctions.thumbnails", "WARNING") as logs:
+            with self.assertRaises(ThumbnailError):
+                cache.get(self.url("/2.png"), SIZES[0])
+        self.assertIn("Not a public host", logs.output[0])
+        self.assertEqual(self.server.hits, {})
+
+    def test_rebound_host_refused(self):
+        # A name resolving to a public address when checked, then to this
+        # server's, is connected to at the address checked or not at all
+        cache = self.make_cache(allow_private_hosts=False)
+        public = [(socket.AF_INET, socket.SOCK_STREAM, 6, "",
+                   ("93.184.216.34", 80))]
+        private = [(socket.AF_INET, socket.SOCK_STREAM, 6, "",
+                    ("127.0.0.1", self.server.server_port))]
+        with mock.patch("socket.getaddrinfo",
+                        side_effect=[public, private, private]), \
+                mock.patch("socket.create_connection",
+                           side_effect=ConnectionRefusedError) as connect, \
+                self.assertLogs("auctions.thumbnails", "WARNING"):
+            with self.assertRaises(ThumbnailError):
+                cache.get("http://rebound.example/4.png", SIZES[0])
+        connect.assert_called_once_with(
+            ("93.184.216.34", 80), mock.ANY, mock.ANY)
+        self.assertEqual(self.server.hits, {})
+
+    def test_evicted_thumbnail_redirects(self):
+        # Evicted between being made and being opened by the view
+        image_url = self.url("/5.png")
+        with mock.patch("auctions.views.thumbnails.get",
+                        return_value=os.path.join(self.directory, "gone")):
+            response = self.client.get(thumbnail_url(image_url, SIZES[0]))
+        self.assertRedirects(response, image_url,
+                             fetch_redirect_response=False)
+
+    def test_eviction(self):
+        self.cache.get(self.url("/3.png"), SIZES[0])
+        image_bytes = sum(size for _, _, size in self.cache._files())
+        # Room for the variants of two images and a half
+        cache = self.make_cache(max_bytes=image_bytes * 5 // 2)
+        for n in range(4, 10):
+            cache.get(self.url(f"/{n}.png"), SIZES[0])
+        self.assertLessEqual(sum(size for _, _, size in cache._files()),
+                             cache.max_bytes)
+        self.assertIsNone(cache.cached(self.url("/3.png"), SIZES[0]))
+        self.assertIsNotNone(cache.cached(self.url("/9.png"), SIZES[0]))
+
+
+class PageCacheTests(TestCase):
+    # Crawl every index page of a catalog larger than Django's default
+    # MAX_ENTRIES, then again, which must be served from the cache
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("cache")
+        category = Category.objects.create(name="Cache")
+        Listing.objects.bulk_create(
+            Listing(seller=seller, category=category, title=f"Listing {i}",
+                    description="Cached", starting_bid=1, current_bid=1,
+                    active=True)
+            for i in range(400))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_pages_are_hits(self):
+        urls = []
+        url = reverse("index")
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            urls.append(url)
+            cursor = response.context["next_cursor"]
+            url = cursor and reverse("index") + f"?cursor={cursor}"
+        self.assertGreater(len(urls), 10)
+
+        hits = cache_stats()["pages"]["hits"]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(cache_stats()["pages"]["hits"] - hits, len(urls))
+
+
+class ApiETagTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("etag_seller")
+        cls.bidder = User.objects.create_user("etag_bidder")
+        cls.listing = Listing.objects.create(
+            seller=cls.seller, category=Category.objects.create(name="ETag"),
+            title="ETag", description="Versioned", starting_bid=10,
+            active=True)
+
+    def assertChangedBy(self, url, write):
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        write()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_bid_changes_etag(self):
+        url = reverse("api_listing", args=[self.listing.id])
+        self.assertChangedBy(
+            url, lambda: place_bid(self.listing, self.bidder, 11))
+        self.assertEqual(self.client.get(url).json()["current_bid"], 11)
+
+    def test_comment_changes_etag(self):
+        self.assertChangedBy(
+            reverse("api_comments", args=[self.listing.id]),
+            lambda: Comment.objects.create(
+                listing=self.listing, user=self.bidder, comment="Hello"))
+
+
+class LeaderboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("boards")
+        category = Category.objects.create(name="Boards")
+        Listing.objects.bulk_create(
+            Listing(seller=seller, category=category, title=f"Board {i}",
+                    description="Ranked", starting_bid=1, current_bid=i + 1,
+                    bid_count=i, active=True)
+            for i in range(10))
+        cls.listings = list(Listing.objects.order_by("bid_count"))
+
+    def test_rebuild_keeps_changes_made_meanwhile(self):
+        boards = Leaderboards()
+        self.assertEqual(boards.top("most_bids", 1), [self.listings[-1].id])
+        build = boards._build
+        underdog = self.listings[0]
+
+        def build_and_bid():
+            result = build()
+            Listing.objects.filter(id=underdog.id).update(
+                current_bid=100, bid_count=100)
+            # Applied to the boards shown, without waiting for the rebuild
+            thread = threading.Thread(
+                target=boards.bid_placed, args=(underdog.id, 100))
+            thread.start()
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
+            return result
+
+        with mock.patch.object(boards, "_build", build_and_bid):
+            boards.rebuild()
+        self.assertEqual(boards.top("highest_price", 1), [underdog.id])
+        self.assertEqual(boards.top("most_bids", 1), [underdog.id])
+
+
+class MinifyTests(SimpleTestCase):
+
+    def test_css(self):
+        self.assertEqual(
+            minify_css("/* Cards */\n.card , .tile > a {\n"
+                       "    color: red ;\n    margin: 0 auto;\n}\n"
+                       "a :hover { color: blue; /* last */ }\n"),
+            ".card,.tile>a{color:red;margin:0 auto}a :hover{color:blue}")
+
+    def test_css_strings_left_alone(self):
+        self.assertEqual(
+            minify_css('a::after { content: ";}" ; }\n'
+                       "q::before { content: '/* ,  > */'; }"),
+            'a::after{content:";}"}q::before{content:\'/* ,  > */\'}')
+
+    def test_js(self):
+        self.assertEqual(
+            minify_js("// Setup\nfunction f() {\n\n    return 1\n}\n"
+                      "    // Done\nlet a = 1  // kept\n"),
+            "function f() {\nreturn 1\n}\nlet a = 1  // kept\n")
+
+    def test_js_template_literals_left_alone(self):
+        self.assertEqual(
+            minify_js("const html = `\n    <p>\n\n    // text\n`;\n"
+                      "    next()\n"),
+            "const html = `\n    <p>\n\n    // text\n`;\nnext()\n")
+
+
+class ArchiveTests(TestCase):
+    # A closed listing with more comments than a page shows
+
+    databases = {"default", archive_database()}
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("archive")
+        cls.listing = Listing.objects.create(
+            seller=user, category=Category.objects.create(name="Archive"),
+            title="Archive", description="Closed", starting_bid=1,
+            active=False)
+        Bid.objects.bulk_create(
+            Bid(item=cls.listing, bid_ammount=i, bidder=user)
+            for i in range(2, 5))
+        Comment.objects.bulk_create(
+            Comment(listing=cls.listing, user=user, comment=f"Comment {i}")
+            for i in range(60))
+        cls.user = user
+
+    def setUp(self):
+        cache.clear()
+
+    def page_comments(self):
+        comments, cursor = [], ""
+        url = reverse("listing", args=[self.listing.id])
+        while cursor is not None:
+            page = self.client.get(
+                f"{url}?comments_after={cursor}").context["comments"]
+            comments += [comment["comment"] for comment in page.items]
+            cursor = page.next_cursor
+        return comments
+
+    def api_comments(self):
+        comments, cursor = [], ""
+        url = reverse("api_comments", args=[self.listing.id])
+        while cursor is not None:
+            page = self.client.get(f"{url}?after={cursor}").json()
+            comments += [comment["comment"] for comment in page["comments"]]
+            cursor = page["next_cursor"]
+        return comments
+
+    def test_comments_shown_after_archiving(self):
+        archive_batch([self.listing.id])
+        Comment.objects.create(listing=self.listing, user=self.user,
+                               comment="Comment 60")
+        expected = [f"Comment {i}" for i in range(61)]
+        self.assertEqual(self.page_comments(), expected)
+        self.assertEqual(self.api_comments(), expected)
+
+    def test_batch_done_again_after_copy(self):
+        with mock.patch("auctions.archive.delete_rows",
+                        side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                archive_batch([self.listing.id])
+        self.assertFalse(ListingArchive.objects.exists())
+        self.assertEqual(ArchivedBid.objects.count(), 3)
+        self.assertEqual(Bid.objects.count(), 3)
+
+        self.assertEqual(archive_batch([self.listing.id]), (3, 60))
+        archive = ListingArchive.objects.get(listing_id=self.listing.id)
+        self.assertEqual((archive.bid_count, archive.comment_count), (3, 60))
+        self.assertEqual(sorted(ArchivedBid.objects.values_list(
+            "bid_ammount", flat=True)), [2, 3, 4])
+        self.assertEqual(ArchivedComment.objects.count(), 60)
+        self.assertFalse(Bid.objects.exists() or Comment.objects.exists())
+        self.assertEqual(self.page_comments(),
+                         [f"Comment {i}" for i in range(60)])
+
+
+class CardTests(SimpleTestCase):
+    # render_card_fast must render CARD_TEMPLATE's markup exactly
+
+    def assertSameCard(self, listing):
+        self.assertEqual(render_card_fast(listing),
+                         render_card_template(listing))
+
+    def test_with_image(self):
+        self.assertSameCard({
+            "id": 1, "title": "Lamp", "description": "Brass desk lamp",
+            "image_url": "https://example.com/lamp.jpg", "current_bid": 25})
+
+    def test_without_image(self):
+        self.assertSameCard({
+            "id": 2, "title": "Chair", "description": "Oak chair",
+            "image_url": "", "current_bid": 40})
+
+    def test_escaped_text(self):
+        self.assertSameCard({
+            "id": 3, "title": '<b>"Tom\'s" & co</b>',
+            "description": "<script>alert('&amp;')</script>",
+            "image_url": "https://example.com/a.jpg?size=2&crop=\"1\"",
+            "current_bid": 1000})
+
+
+class ListingFormTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Forms")
+
+    def form(self, ends_at):
+        return ListingForm({
+            "title": "Clock", "description": "Wall clock",
+            "category": self.category.id, "starting_bid": 5,
+            "ends_at": ends_at})
+
+    def test_ends_at_in_the_future(self):
+        ends_at = timezone.localtime() + timedelta(days=1)
+        form = self.form(ends_at.strftime("%Y-%m-%d %H:%M"))
+        self.assertTrue(form.is_valid())
+        self.assertTrue(self.form("").is_valid())
+
+    def test_ends_at_in_the_past(self):
+        ends_at = timezone.localtime() - timedelta(minutes=1)
+        form = self.form(ends_at.strftime("%Y-%m-%d %H:%M"))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["ends_at"],
+                         ["The auction must end in the future."])
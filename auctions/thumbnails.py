@@ -0,0 +1,290 @@
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+from urllib.request import (HTTPHandler, HTTPRedirectHandler, HTTPSHandler,
+                            ProxyHandler, Request, build_opener)
+
+from django.conf import settings
+from django.core import signing
+
+from .util import url_prefix
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Widths and heights of the variants made of each image: grid cards and
+# the listing page
+SIZES = (200, 300)
+
+# Seconds to wait for an image host, and for a thumbnail to be made
+FETCH_TIMEOUT = 10
+WAIT_TIMEOUT = 5
+
+# Largest original image fetched, in bytes
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Seconds a failed image URL is left alone before being fetched again
+RETRY_AFTER = 300
+
+SALT = "auctions.thumbnails"
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def thumbnail_url(image_url, size):
+    """
+    Return the URL of a thumbnail of the image, or the image URL itself
+    when Pillow isn't installed. The image URL is signed into the path, so
+    only images shown by the site are proxied.
+    """
+    if Image is None or not image_url:
+        return image_url
+    # Unlike dumps, the signature has no timestamp, so the URL is the same
+    # on every render and browsers can cache it
+    token = signing.Signer(salt=SALT).sign_object(image_url, compress=True)
+    return url_prefix("thumbnail", size) + token
+
+
+def image_url_from_token(token):
+    return signing.Signer(salt=SALT).unsign_object(token)
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                    source_address=None):
+    """
+    Connect like socket.create_connection, but only if every address of the
+    host is public, and to those very addresses: the name isn't resolved
+    again, so it can't be rebound to a private one in between.
+    """
+    # Don't let listings make the server fetch from its own network
+    host, port = address
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ThumbnailError(f"Can't resolve {host}")
+    if not all(ipaddress.ip_address(sockaddr[0]).is_global
+               for *_, sockaddr in addresses):
+        raise ThumbnailError(f"Not a public host: {host}")
+    error = None
+    for *_, sockaddr in addresses:
+        try:
+            return socket.create_connection(
+                (sockaddr[0], port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class PublicHTTPConnection(HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class PublicHTTPSConnection(HTTPSConnection):
+    # Connected to the checked address, verified against the host name
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class PublicHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(HTTPRedirectHandler):
+    # Follow redirects only to http(s) URLs, opened by the handlers above
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urlsplit(newurl).scheme not in ("http", "https"):
+            raise ThumbnailError(f"Redirected to a non-http(s) URL: {newurl}")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class ThumbnailCache:
+    """
+    Resized variants of remote images, fetched once and made in a thread
+    pool. Files are named by the hash of the original image, so the same
+    image behind several URLs is stored once, and the least recently served
+    ones are deleted when the directory outgrows max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, workers=4,
+                 allow_private_hosts=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.allow_private_hosts = allow_private_hosts
+        # Redirects are opened by the same handlers, so checked alike. No
+        # proxy is used, as it would connect wherever the name resolves.
+        self.opener = build_opener() if allow_private_hosts else \
+            build_opener(ProxyHandler({}), PublicHTTPHandler,
+                         PublicHTTPSHandler, PublicRedirectHandler)
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumbnails")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.failed = {}
+        self.used = None
+
+    def _url_path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, "urls", digest[:2], digest)
+
+    def _variant_path(self, digest, size):
+        return os.path.join(self.directory, digest[:2], f"{digest}-{size}.jpg")
+
+    def cached(self, url, size):
+        # Path of the variant if it was made already, or None
+        try:
+            with open(self._url_path(url)) as f:
+                digest = f.read()
+        except FileNotFoundError:
+            return None
+        path = self._variant_path(digest, size)
+        return path if os.path.exists(path) else None
+
+    def get(self, url, size, timeout=WAIT_TIMEOUT):
+        """
+        Return the path of the image's variant of the given size, making
+        every variant of the image first if needed. Raise ThumbnailError if
+        the image can't be fetched or takes longer than timeout.
+        """
+        if Image is None:
+            raise ThumbnailError("Pillow is not installed.")
+        path = self.cached(url, size)
+        if path is None:
+            try:
+                self.submit(url).result(timeout)
+            except TimeoutError:
+                raise ThumbnailError(f"Timed out making thumbnails of {url}.")
+            path = self.cached(url, size)
+            if path is None:
+                raise ThumbnailError(f"Thumbnail of {url} was evicted.")
+        try:
+            # Served files are the recently used ones
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def submit(self, url):
+        # Future making the variants of the image, shared by every request
+        # for it until it's done
+        with self.lock:
+            future = self.pending.get(url)
+            submitted = future is None
+            if submitted:
+                future = self.pool.submit(self._make, url)
+                self.pending[url] = future
+        # Outside the lock: a future already done calls it right away
+        if submitted:
+            future.add_done_callback(lambda _: self._done(url))
+        return future
+
+    def _done(self, url):
+        with self.lock:
+            self.pending.pop(url, None)
+
+    def _make(self, url):
+        if self.failed.get(url, 0) > time.monotonic() - RETRY_AFTER:
+            raise ThumbnailError(f"{url} failed recently.")
+        try:
+            original = self._fetch(url)
+            digest = hashlib.sha256(original).hexdigest()
+            image = Image.open(io.BytesIO(original))
+            image.load()
+            image = image.convert("RGB")
+            for size in SIZES:
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                data = io.BytesIO()
+                variant.save(data, "JPEG", quality=85, optimize=True)
+                self._write(self._variant_path(digest, size),
+                            data.getvalue())
+            self._write(self._url_path(url), digest.encode(), counted=False)
+        except Exception as error:
+            self.failed[url] = time.monotonic()
+            logger.warning("Can't make thumbnails of %s: %s", url, error)
+            raise ThumbnailError(str(error)) from error
+        self.failed.pop(url, None)
+
+    def _fetch(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ThumbnailError(f"Not an http(s) URL: {url}")
+        request = Request(url, headers={"User-Agent": "auctions-thumbnails"})
+        with self.opener.open(request, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_IMAGE_BYTES + 1)
+        if len(data) > MAX_IMAGE_BYTES:
+            raise ThumbnailError(f"{url} is larger than {MAX_IMAGE_BYTES} bytes.")
+        return data
+
+    def _write(self, path, data, counted=True):
+        # Write through a temporary file, so a half-written file is never
+        # served. Only thumbnails count towards max_bytes.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        if not counted:
+            return
+        with self.lock:
+            if self.used is None:
+                self.used = sum(size for _, _, size in self._files())
+            else:
+                self.used += len(data)
+            if self.used > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        # (mtime, path, size) of every thumbnail
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory:
+                dirs[:] = [d for d in dirs if d != "urls"]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, path, stat.st_size
+
+    def _evict(self):
+        # Delete least recently served thumbnails down to 90% of the bound
+        files = sorted(self._files())
+        self.used = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if self.used <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.used -= size
+
+
+thumbnails = ThumbnailCache(
+    settings.THUMBNAIL_DIR, settings.THUMBNAIL_MAX_BYTES,
+    workers=settings.THUMBNAIL_WORKERS,
+    allow_private_hosts=settings.THUMBNAIL_ALLOW_PRIVATE_HOSTS)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -9,9 +9,21 @@ urlpatterns = [
     path("register", views.register, name="register"),
     path("create-listing", views.create_listing, name="create_listing"),
     path("listing/<str:id>", views.listing, name="listing"),
+    path("listing/<int:id>/comments", views.comments, name="comments"),
     path("watchlist", views.watchlist, name="watchlist"),
     path("add-to-watchlist", views.add_to_watchlist, name="add_to_watchlist"),
     path("remove-from-watchlist", views.remove_from_watchlist, name="remove_from_watchlist"),
     path("categories", views.categories, name="categories"),
-    path("categories/<str:category_name>", views.category, name="category")
+    path("categories/<str:category_name>", views.category, name="category"),
+    path("search", views.search, name="search"),
+    path("thumbnails/<int:size>/<str:token>", views.thumbnail, name="thumbnail"),
+    path("_cache", views.cache_stats_view, name="cache_stats"),
+    path("_perf", views.perf, name="perf"),
+    path("api/listings", api.listings, name="api_listings"),
+    path("api/listings/<int:id>", api.listing, name="api_listing"),
+    path("api/listings/<int:id>/bids", api.bids, name="api_bids"),
+    path("api/listings/<int:id>/comments", api.comments, name="api_comments"),
+    path("api/listings/<int:id>/history", api.history, name="api_history"),
+    path("api/categories", api.categories, name="api_categories"),
+    path("api/categories/<str:category_name>", api.category, name="api_category")
 ]
@@ -1,25 +1,118 @@
-from django.db.models import Max
+from functools import lru_cache
+
+from django.db.models import F
+from django.urls import get_script_prefix, reverse
+from django.utils.functional import cached_property
+
+from .models import Comment, ArchivedComment, ListingArchive
+
+# Number of listings shown per page in the grids
+PAGE_SIZE = 24
+
+# Number of comments shown at once on a listing page
+COMMENTS_PAGE_SIZE = 50
 
 
 def get_active_listings(listings):
-    active_listings = []
-
-    for listing in listings:
-        active_listing = {
-            "id": listing.id,
-            "title": listing.title,
-            "description": listing.description,
-            "image_url": listing.image_url,
-            "current_bid": listing.starting_bid
-        }
-
-        # Get highest bid
-        if listing.bids.all():
-            highest_bid = listing.bids.aggregate(Max("bid_ammount"))[
-                "bid_ammount__max"]
-            if highest_bid >= listing.starting_bid:
-                active_listing["current_bid"] = highest_bid
-
-        active_listings.append(active_listing)
-
-    return active_listings
+    # One query for the whole grid, whatever the number of listings or bids
+    return listings.values(
+        "id", "title", "description", "image_url", "current_bid")
+
+
+def paginate(listings, cursor, page_size=PAGE_SIZE):
+    """
+    Return one page of listings ordered by id, plus the cursors of the
+    next and previous pages (None when there is no such page).
+
+    Cursors are "a<id>" for the page after a listing and "b<id>" for the
+    page before it, so each page is an indexed range scan on id rather than
+    an OFFSET that gets slower the deeper it goes.
+    """
+    direction, after_id = (cursor or "")[:1], (cursor or "")[1:]
+    if direction not in ("a", "b") or not after_id.isdigit():
+        direction, after_id = None, None
+
+    if direction == "b":
+        page = list(listings.filter(id__lt=after_id)
+                    .order_by("-id")[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size][::-1]
+        prev_cursor = f"b{page[0]['id']}" if has_more else None
+        next_cursor = f"a{page[-1]['id']}" if page else None
+    else:
+        if direction == "a":
+            listings = listings.filter(id__gt=after_id)
+        page = list(listings.order_by("id")[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        next_cursor = f"a{page[-1]['id']}" if has_more else None
+        prev_cursor = f"b{page[0]['id']}" if direction and page else None
+
+    return page, next_cursor, prev_cursor
+
+
+def url_prefix(name, *args):
+    """
+    Return the path of the URL named name up to its last argument, which
+    the caller appends, e.g. "/listing/" for "listing". It is reversed once
+    per script prefix, as reverse() is slow when called for every card.
+    """
+    return _url_prefix(name, args, get_script_prefix())
+
+
+@lru_cache(maxsize=None)
+def _url_prefix(name, args, script_prefix):
+    return reverse(name, args=[*args, 0])[:-1]
+
+
+class CommentPage:
+    """
+    A page of a listing's comments, oldest first, after the comment with id
+    after, as dicts of id, comment and user_name. It is fetched on first
+    use, so a comment posted earlier in the request is included.
+
+    The comments of an archived listing are read from the archive, followed
+    by any posted since. Pass archived if it is known, to save looking it
+    up.
+    """
+
+    def __init__(self, listing_id, after=None, page_size=COMMENTS_PAGE_SIZE,
+                 archived=None):
+        self.listing_id = listing_id
+        self.after = after
+        self.page_size = page_size
+        self.archived = archived
+
+    def _comments(self, comments, after, limit):
+        comments = comments.filter(listing_id=self.listing_id).order_by("id")
+        if after:
+            comments = comments.filter(id__gt=after)
+        return list(comments[:limit])
+
+    @cached_property
+    def _page(self):
+        limit = self.page_size + 1
+        if self.archived is None:
+            self.archived = ListingArchive.objects.filter(
+                listing_id=self.listing_id).exists()
+        page = []
+        if self.archived:
+            page = self._comments(ArchivedComment.objects.values(
+                "id", "comment", "user_name"), self.after, limit)
+        if len(page) < limit:
+            page += self._comments(
+                Comment.objects.values("id", "comment",
+                                       user_name=F("user__username")),
+                page[-1]["id"] if page else self.after, limit - len(page))
+        return page
+
+    @property
+    def items(self):
+        return self._page[:self.page_size]
+
+    @property
+    def next_cursor(self):
+        # Id of the last comment shown, if there are more after it
+        if len(self._page) > self.page_size:
+            return self._page[self.page_size - 1]["id"]
+        return None
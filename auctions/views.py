@@ -1,27 +1,66 @@
 from django.contrib.auth import authenticate, login, logout
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect, JsonResponse)
 from django.shortcuts import render
 from django.urls import reverse
-from django.forms import ModelForm
-from django.core.exceptions import ObjectDoesNotExist
-
-from .models import User, Category, Listing, Watchlist, Comment, Bid
-from .util import get_active_listings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.http import require_safe
+from django.forms import DateTimeInput, ModelForm
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+
+from .models import User, Category, Listing, Watchlist, Comment
+from .bidding import BidError, place_bid
+from .db import read_only
+from .expiry import close_listings
+from .cache import (cache_anonymous_page, cache_stats, render_listing_cards,
+                    watchlist_ids)
+from .leaderboards import top_listings
+from .middleware import perf_stats
+from .notifications import notification_stats
+from .search import search as search_listings
+from .stats import price_facets
+from .thumbnails import (SIZES, ThumbnailError, image_url_from_token,
+                         thumbnails)
+from .util import CommentPage, get_active_listings, paginate
 
 
 class ListingForm(ModelForm):
     class Meta:
         model = Listing
         fields = ["title", "description",
-                  "category", "image_url", "starting_bid"]
+                  "category", "image_url", "starting_bid", "ends_at"]
+        widgets = {
+            "ends_at": DateTimeInput(attrs={"type": "datetime-local"})
+        }
+
+    def clean_ends_at(self):
+        # An auction ending in the past would be closed as soon as created
+        ends_at = self.cleaned_data["ends_at"]
+        if ends_at is not None and ends_at <= timezone.now():
+            raise ValidationError("The auction must end in the future.")
+        return ends_at
 
 
+@cache_anonymous_page("listings")
+@read_only
 def index(request):
-    listings = Listing.objects.exclude(active=False).all()
-    active_listings = get_active_listings(listings)
+    listings = Listing.objects.active()
+    active_listings, next_cursor, prev_cursor = paginate(
+        get_active_listings(listings), request.GET.get("cursor"))
+    # Rankings head the first page only
+    sections = [] if request.GET.get("cursor") else top_listings()
+    render_listing_cards({listing["id"]: listing for section in sections
+                          for listing in section["listings"]}.values())
     return render(request, "auctions/index.html", {
-        "active_listings": active_listings
+        "sections": sections,
+        "active_listings": render_listing_cards(active_listings),
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
     })
 
 
@@ -81,20 +120,22 @@ def create_listing(request):
     if request.method == "POST":
         form = ListingForm(request.POST)
         if form.is_valid():
-            user = User.objects.get(id=request.user.id)
-            partial_listing = Listing(seller=user, active=True)
+            partial_listing = Listing(seller=request.user, active=True)
             listing = ListingForm(request.POST, instance=partial_listing)
             listing.save()
             return HttpResponseRedirect(reverse("index"))
-
-    form = ListingForm()
+    else:
+        form = ListingForm()
     return render(request, "auctions/create-listing.html", {
         "form": form
     })
 
 
+@cache_anonymous_page(lambda id: f"listing:{int(id)}")
+@read_only
 def listing(request, id):
-    listing = Listing.objects.get(id=id)
+    listing = Listing.objects.select_related(
+        "highest_bidder", "archive").get(id=id)
 
     # Data that will be passed to template:
     context = {
@@ -103,31 +144,24 @@ def listing(request, id):
         "current_bid": None,
         "highest_bidder": None,
         "watchlisted": False,
-        "is_owner": listing.seller.id == request.user.id,
-        "comments": Comment.objects.filter(listing=listing)
+        "is_owner": listing.seller_id == request.user.id,
+        "comments": CommentPage(listing.id, comments_after(request),
+                                archived=hasattr(listing, "archive"))
     }
 
     # Get listing's highest bid
-    if listing.bids.all():
-        highest_bid = listing.bids.order_by("bid_ammount").last()
-        if highest_bid.bid_ammount >= context["starting_bid"]:
-            context["current_bid"] = highest_bid.bid_ammount
-            context["highest_bidder"] = highest_bid.bidder
+    if listing.bid_count:
+        context["current_bid"] = listing.current_bid
+        context["highest_bidder"] = listing.highest_bidder
 
     # Handle things with logged in user
     if request.user.is_authenticated:
 
-        # Check if listing is in user's watchlist
-        user = User.objects.get(id=request.user.id)
+        # Loaded once per request by AuthenticationMiddleware
+        user = request.user
 
         # Check if listing is in user's watchlist
-        try:
-            for item in user.watchlist.values():
-                if item['listing_id'] == int(id):
-                    context["watchlisted"] = True
-                    break
-        except Watchlist.DoesNotExist:
-            pass
+        context["watchlisted"] = listing.id in watchlist_ids(request)
 
         # Post requests
         if request.method == "POST":
@@ -135,35 +169,34 @@ def listing(request, id):
             # Handle bid
             try:
                 bid_ammount = int(request.POST["bid"])
-                error = None
 
-                # Check if bid can be placed
-                if not listing.bids.all():
-                    if bid_ammount < context["starting_bid"]:
-                        error = "Your bid must be higher than or equal to the starting bid."
-                else:
-                    if bid_ammount <= context["current_bid"]:
-                        error = "Your bid must be higher than the current bid."
-
-                if error == None:
-                    # Place user's bid
-                    bid = Bid(item=listing,
-                              bid_ammount=bid_ammount, bidder=user)
-                    bid.save()
-                    context["bid_placed"] = True
-                    context["current_bid"] = bid.bid_ammount
-                    return render(request, "auctions/listing.html", context)
-                else:
-                    context["bid_error"] = error
+                # Place user's bid if it beats the current one
+                try:
+                    bid = place_bid(listing, user, bid_ammount)
+                except BidError as error:
+                    if listing.bid_count:
+                        context["current_bid"] = listing.current_bid
+                    context["bid_error"] = str(error)
                     return render(request, "auctions/listing.html", context)
+
+                context["bid_placed"] = True
+                context["current_bid"] = bid.bid_ammount
+                context["highest_bidder"] = user
+                return render(request, "auctions/listing.html", context)
             except Exception:
                 pass
 
             # Handle auction closing
             try:
                 request.POST["close-auction"]
-                listing.active = False
-                listing.save()
+                # Only the seller's own, still active listing, without
+                # writing back the bid columns as loaded
+                if close_listings(Listing.objects.filter(
+                        id=listing.id, seller_id=user.id)):
+                    listing.refresh_from_db()
+                    if listing.bid_count:
+                        context["current_bid"] = listing.current_bid
+                        context["highest_bidder"] = listing.highest_bidder
                 return render(request, "auctions/listing.html", context)
             except Exception:
                 pass
@@ -184,22 +217,42 @@ def listing(request, id):
     return render(request, "auctions/listing.html", context)
 
 
+def comments_after(request, parameter="comments_after"):
+    after = request.GET.get(parameter, "")
+    return int(after) if after.isdigit() else None
+
+
+@read_only
+def comments(request, id):
+    page = CommentPage(id, comments_after(request, "after"))
+    return JsonResponse({
+        "comments": [{
+            "id": comment["id"],
+            "user": comment["user_name"],
+            "comment": comment["comment"]
+        } for comment in page.items],
+        "next_cursor": page.next_cursor
+    })
+
+
+@read_only
 def watchlist(request):
-    user = User.objects.get(id=request.user.id)
-    items = user.watchlist.all()
-    listings = [i.listing for i in items]
-    active_listings = get_active_listings(listings)
+    listings = Listing.objects.filter(id__in=Watchlist.objects.filter(
+        user_id=request.user.id).values("listing_id"))
+    active_listings, next_cursor, prev_cursor = paginate(
+        get_active_listings(listings), request.GET.get("cursor"))
     return render(request, "auctions/watchlist.html", {
-        "active_listings": active_listings
+        "active_listings": render_listing_cards(active_listings),
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
     })
 
 
 def add_to_watchlist(request):
     listing_id = request.POST['add-to-watchlist']
-    user = User.objects.get(id=request.user.id)
-    listing = Listing.objects.get(id=listing_id)
-    watchlist = Watchlist(user=user, listing=listing)
-    watchlist.save()
+    # Adding a listing twice keeps the single row already there
+    Watchlist.objects.get_or_create(
+        user_id=request.user.id, listing_id=listing_id)
     if request.POST["page"] == "listing":
         return HttpResponseRedirect(reverse("listing", kwargs={"id": listing_id}))
     return HttpResponseRedirect(reverse("watchlist"))
@@ -215,20 +268,107 @@ def remove_from_watchlist(request):
     return HttpResponseRedirect(reverse("watchlist"))
 
 
+@cache_anonymous_page("categories")
+@read_only
 def categories(request):
-    categories = Category.objects.all()
+    # Each category's summary comes joined in, so one query for the page
+    categories = Category.objects.select_related("stats")
     return render(request, "auctions/categories.html", {
         "categories": categories
     })
 
 
+def price_bounds(request):
+    # Ignore price bounds that aren't whole numbers
+    prices = {}
+    for bound in ("min_price", "max_price"):
+        try:
+            prices[bound] = int(request.GET[bound])
+        except (KeyError, ValueError):
+            prices[bound] = None
+    return prices
+
+
+@cache_anonymous_page(lambda category_name: f"category:{category_name}",
+                      "categories")
+@read_only
 def category(request, category_name):
-    category = Category.objects.get(name=category_name)
+    category = Category.objects.select_related("stats").get(
+        name=category_name)
+    # Missing until the category's first listing or a stats rebuild
+    stats = getattr(category, "stats", None)
     listings = category.listings.filter(active=True).all()
-    active_listings = get_active_listings(listings)
+    prices = price_bounds(request)
+    if prices["min_price"] is not None:
+        listings = listings.filter(current_bid__gte=prices["min_price"])
+    if prices["max_price"] is not None:
+        listings = listings.filter(current_bid__lte=prices["max_price"])
+    active_listings, next_cursor, prev_cursor = paginate(
+        get_active_listings(listings), request.GET.get("cursor"))
     return render(request, "auctions/category.html", {
         "category": category,
-        "active_listings": active_listings
+        "stats": stats,
+        "price_facets": price_facets(stats),
+        "filters": urlencode({bound: price for bound, price in prices.items()
+                              if price is not None}),
+        "active_listings": render_listing_cards(active_listings),
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    })
+
+
+@read_only
+def search(request):
+    query = request.GET.get("q", "")
+    category = request.GET.get("category", "")
+    prices = price_bounds(request)
+    results = search_listings(query, category=category, **prices)
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "category": category,
+        "min_price": prices["min_price"],
+        "max_price": prices["max_price"],
+        "categories": Category.objects.all(),
+        "active_listings": render_listing_cards(results)
     })
 
 
+@require_safe
+def thumbnail(request, size, token):
+    if size not in SIZES:
+        raise Http404
+    try:
+        image_url = image_url_from_token(token)
+    except signing.BadSignature:
+        raise Http404
+    try:
+        # The file may be evicted between the two
+        file = open(thumbnails.get(image_url, size), "rb")
+    except (ThumbnailError, FileNotFoundError):
+        # Let the browser try the original image
+        return HttpResponseRedirect(image_url)
+    response = FileResponse(file, content_type="image/jpeg")
+    # The URL names the image, so what it points to never changes
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60,
+                        immutable=True)
+    return response
+
+
+@staff_member_required
+def cache_stats_view(request):
+    return JsonResponse(cache_stats())
+
+
+@staff_member_required
+def perf(request):
+    stats = perf_stats()
+    stats["cache"] = cache_stats()
+    stats["notifications"] = notification_stats()
+    if request.GET.get("format") == "json":
+        return JsonResponse(stats)
+    return render(request, "auctions/perf.html", {
+        "views": sorted(stats["views"].items()),
+        "profiles": stats["profiles"],
+        "cache": stats["cache"],
+        "notifications": stats["notifications"]
+    })
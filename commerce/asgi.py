@@ -2,6 +2,8 @@
 ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Listing event streams are served here directly, so a watcher holds an
+open connection without tying up one of Django's sync worker threads.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from auctions.events import EVENTS_PATH, listing_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        match = EVENTS_PATH.match(scope['path'])
+        if match:
+            return await listing_events(scope, receive, send, int(match[1]))
+    await django_application(scope, receive, send)
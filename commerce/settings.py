@@ -41,7 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'auctions.middleware.StaticAssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,8 +58,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parsed templates are kept for the life of the process, also
+            # with DEBUG on (runserver's autoreloader clears them on edits)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -68,21 +77,122 @@ TEMPLATES = [
     },
 ]
 
+# Render listing cards with auctions.cards.render_card_fast rather than the
+# listing-card.html template (same markup, checked by bench_cards)
+
+LISTING_CARD_FAST_PATH = True
+
 WSGI_APPLICATION = 'commerce.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# The replica is a second, read-only handle on the same file, used by
+# read-only views through auctions.db.ReplicaRouter. With WAL, its readers
+# don't wait for writers on the primary.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:{}?mode=ro'.format(os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'uri': True,
+            'timeout': 20,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+    # The bids and comments of long closed auctions, moved by
+    # archive_listings, are kept in tables of the default database. To keep
+    # them in a database of their own, add it here as 'archive', e.g.
+    #
+    # 'archive': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': os.path.join(BASE_DIR, 'archive.sqlite3'),
+    #     'CONN_MAX_AGE': 60,
+    #     'OPTIONS': {
+    #         'timeout': 20,
+    #     },
+    # },
+    #
+    # and create its tables with: manage.py migrate --database archive
+}
+
+DATABASE_ROUTERS = ['auctions.db.ArchiveRouter', 'auctions.db.ReplicaRouter']
+
+# Applied to every SQLite connection by auctions.db.tune_sqlite
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'busy_timeout': 20000,
 }
 
 AUTH_USER_MODEL = 'auctions.User'
 
+# Users of sessions are cached for a few seconds by auctions.auth, and
+# sessions are read from the cache, falling back to the database, so an
+# authenticated request usually runs no auth queries
+
+AUTHENTICATION_BACKENDS = ['auctions.auth.CachedUserBackend']
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Pages and listing cards are invalidated by signals in the process that
+# handled the write, so use FileBasedCache when running several processes.
+# Each listing takes two entries, its version and its card, plus one per
+# cached page: past MAX_ENTRIES a third of them, version keys included, are
+# dropped at random, so keep it well above twice the number of listings.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auctions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# Request instrumentation (auctions.middleware.PerformanceMiddleware),
+# reported to staff at /_perf
+
+PERF_QUERY_WARNING = 20
+PERF_PROFILE_RATE = 0.0
+PERF_SLOW_MS = 500
+
+# Listing image thumbnails (auctions.thumbnails), made when Pillow is
+# installed; without it pages show the original images
+
+THUMBNAIL_DIR = os.path.join(BASE_DIR, 'thumbnails')
+THUMBNAIL_MAX_BYTES = 256 * 1024 * 1024
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_ALLOW_PRIVATE_HOSTS = False
+
+# Where auctions.notifications sends outbid and closed auction notices:
+# FileSink(path), EmailSink(from_email) through EMAIL_BACKEND, or
+# WebhookSink(url)
+
+NOTIFICATION_SINK = {
+    'BACKEND': 'auctions.notifications.FileSink',
+    'OPTIONS': {'path': os.path.join(BASE_DIR, 'notifications.jsonl')},
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,3 +230,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Run collectstatic to fill STATIC_ROOT with hashed, minified and
+# precompressed files, which StaticAssetMiddleware serves
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'auctions.storage.CompressedManifestStaticFilesStorage'